@@ -1,114 +1,195 @@
 #!/usr/bin/env python3
 """
 Single Python script to run both FastAPI (uvicorn) and Streamlit servers simultaneously.
-Usage: python run_app.py
+Usage:
+    python run_app.py                                # development (auto-reload, single worker)
+    python run_app.py --prod --workers 4             # production (multiple workers, graceful drain)
+    python run_app.py --prod --workers 4 --shared-cache /var/cache/apmt-chatbot
 """
 
+import argparse
+import os
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
 import time
-import multiprocessing
+import urllib.request
 from pathlib import Path
 
 
-def run_uvicorn():
-    """Run the FastAPI server with uvicorn"""
-    print("🚀 Starting FastAPI server on http://localhost:8000")
-    try:
-        subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "src.main:app", 
-            "--reload", 
-            "--host", "0.0.0.0", 
-            "--port", "8000"
-        ], check=True)
-    except KeyboardInterrupt:
-        print("\n⏹️  FastAPI server stopped")
-    except Exception as e:
-        print(f"❌ Error running FastAPI server: {e}")
+def start_uvicorn(args):
+    """Start the FastAPI server with uvicorn"""
+    command = [
+        sys.executable, "-m", "uvicorn",
+        "src.main:app",
+        "--host", args.host,
+        "--port", str(args.port)
+    ]
+    if args.prod:
+        # uvicorn forwards SIGTERM to its workers, which stop accepting connections
+        # and let in-flight requests finish for up to the graceful timeout
+        command += [
+            "--workers", str(args.workers),
+            "--timeout-graceful-shutdown", str(args.graceful_timeout),
+            "--no-access-log"
+        ]
+    else:
+        command.append("--reload")
+
+    env = os.environ.copy()
+    # Background jobs are drained after uvicorn has finished its own graceful shutdown,
+    # so both phases share the same timeout
+    env["JOB_DRAIN_TIMEOUT"] = str(args.graceful_timeout)
+    if args.shared_cache:
+        env["CACHE_BACKEND"] = "disk"
+        env["CACHE_DIR"] = args.shared_cache
 
+    mode = f"production, {args.workers} workers" if args.prod else "development"
+    print(f"🚀 Starting FastAPI server on http://localhost:{args.port} ({mode})")
+    return subprocess.Popen(command, env=env)
 
-def run_streamlit():
-    """Run the Streamlit app"""
+
+def start_streamlit():
+    """Start the Streamlit app"""
     print("🎨 Starting Streamlit app on http://localhost:8501")
+    return subprocess.Popen([
+        sys.executable, "-m", "streamlit",
+        "run",
+        "src/streamlit_app.py"
+    ])
+
+
+def wait_until_ready(process, url, timeout):
+    """Poll the health endpoint until it answers 200, the server exits, or the timeout expires"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def stop_process(process, timeout):
+    """Send SIGTERM and wait, killing the process if it does not exit in time"""
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
     try:
-        subprocess.run([
-            sys.executable, "-m", "streamlit", 
-            "run", 
-            "src/streamlit_app.py"
-        ], check=True)
-    except KeyboardInterrupt:
-        print("\n⏹️  Streamlit app stopped")
-    except Exception as e:
-        print(f"❌ Error running Streamlit app: {e}")
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the APMT Analytics Chatbot")
+    parser.add_argument("--prod", action="store_true",
+                        help="Production mode: no auto-reload, multiple workers, graceful shutdown")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "4")),
+                        help="Number of uvicorn worker processes in production mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--graceful-timeout", type=int, default=300,
+                        help="Seconds to let in-flight requests finish on shutdown (and again for queued chat jobs)")
+    parser.add_argument("--ready-timeout", type=int, default=60,
+                        help="Seconds to wait for /health before giving up")
+    parser.add_argument("--shared-cache", metavar="DIR",
+                        help="Use an on-disk cache shared by all workers. With --prod and --workers > 1 a private "
+                             "temporary directory is used when this is not given")
+    return parser.parse_args()
 
 
 def main():
     """Main function to run both servers"""
+    args = parse_args()
+
     print("🤖 Starting APMT Analytics Chatbot...")
     print("📁 Current directory:", Path.cwd())
     print()
-    
+
     # Check if required files exist
     main_file = Path("src/main.py")
     streamlit_file = Path("src/streamlit_app.py")
-    
+
     if not main_file.exists():
         print(f"❌ Error: {main_file} not found!")
         sys.exit(1)
-    
+
     if not streamlit_file.exists():
         print(f"❌ Error: {streamlit_file} not found!")
         sys.exit(1)
-    
-    # Create processes for both servers
-    uvicorn_process = multiprocessing.Process(target=run_uvicorn)
-    streamlit_process = multiprocessing.Process(target=run_streamlit)
-    
+
+    # Job records, figures and cached results must be visible to every worker: a job polled on a
+    # worker that did not queue it would otherwise be reported as not found
+    temporary_cache = None
+    if args.prod and args.workers > 1 and not args.shared_cache:
+        temporary_cache = args.shared_cache = tempfile.mkdtemp(prefix="apmt-chatbot-cache-")
+        print(f"ℹ️  {args.workers} workers need a shared cache for chat jobs and figures; using {temporary_cache} "
+              "(pass --shared-cache DIR to keep it across restarts)")
+
+    # Turn SIGTERM into the same shutdown path as Ctrl+C
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    uvicorn_process = None
+    streamlit_process = None
+
     try:
-        # Start FastAPI server
-        uvicorn_process.start()
-        
-        # Wait a moment for FastAPI to start
-        time.sleep(3)
-        
+        # Start FastAPI server and wait until it answers health checks
+        uvicorn_process = start_uvicorn(args)
+        health_url = f"http://localhost:{args.port}/health"
+        if not wait_until_ready(uvicorn_process, health_url, args.ready_timeout):
+            print(f"❌ Error: FastAPI server did not become ready at {health_url}")
+            stop_process(uvicorn_process, timeout=5)
+            sys.exit(1)
+
         # Start Streamlit app
-        streamlit_process.start()
-        
+        streamlit_process = start_streamlit()
+
         print("\n✅ Both servers are running!")
-        print("📊 FastAPI: http://localhost:8000")
+        print(f"📊 FastAPI: http://localhost:{args.port}")
         print("🎨 Streamlit: http://localhost:8501")
         print("\nPress Ctrl+C to stop both servers")
-        
+
         # Wait for both processes
-        uvicorn_process.join()
-        streamlit_process.join()
-        
+        uvicorn_process.wait()
+        streamlit_process.wait()
+
     except KeyboardInterrupt:
         print("\n\n⏹️  Shutting down servers...")
-        
-        # Terminate processes
-        if uvicorn_process.is_alive():
-            uvicorn_process.terminate()
-            uvicorn_process.join(timeout=5)
-        
-        if streamlit_process.is_alive():
-            streamlit_process.terminate()
-            streamlit_process.join(timeout=5)
-        
+
+        # Stop the UI first, then let the API drain in-flight chains
+        stop_process(streamlit_process, timeout=5)
+        # uvicorn finishes in-flight requests, then the shutdown hook drains chat jobs
+        stop_process(uvicorn_process, timeout=2 * args.graceful_timeout + 10)
+
         print("✅ All servers stopped successfully!")
-    
+
     except Exception as e:
         print(f"❌ Error: {e}")
+        stop_process(streamlit_process, timeout=5)
+        stop_process(uvicorn_process, timeout=5)
         sys.exit(1)
 
+    finally:
+        if temporary_cache:
+            shutil.rmtree(temporary_cache, ignore_errors=True)
+
 
 if __name__ == "__main__":
     # Ensure we're running in the correct directory
     script_dir = Path(__file__).parent
     if script_dir != Path.cwd():
         print(f"📁 Changing directory to: {script_dir}")
-        import os
         os.chdir(script_dir)
-    
+
     main()
@@ -0,0 +1,219 @@
+from dotenv import load_dotenv
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+load_dotenv(override=True)
+
+# Admission control configuration
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_QUEUE_PER_KEY = int(os.getenv("ADMISSION_MAX_QUEUE_PER_KEY", "8"))  # waiting requests per user/session
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "60"))  # seconds a /chat request may wait for a slot
+
+# Weight of the newest sample in the moving averages
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted in time; retry_after is a hint in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "wake", "granted", "enqueued_at")
+
+    def __init__(self, wake=None):
+        # wake() is called under the controller lock when the slot is handed over
+        self.event = threading.Event()
+        self.wake = wake or self.event.set
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Global in-flight cap with a bounded wait queue and fair scheduling.
+
+    Waiters are grouped per key (user or session). When a slot frees up the
+    keys are served round-robin, and each key may hold at most max_queue_per_key
+    of the waiting places, so one busy user can neither starve nor crowd out
+    everyone else. Requests are rejected straight away when the queue (or their
+    key's share of it) is full or when the estimated wait already exceeds their deadline.
+    """
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_queue_per_key: int = ADMISSION_MAX_QUEUE_PER_KEY):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queues = OrderedDict()  # key -> deque of _Waiter, in round-robin order
+        self._waiting = 0
+
+        # Metrics
+        self._admitted_total = 0
+        self._rejected_total = 0
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_service = 0.0
+
+    def _estimated_wait(self) -> float:
+        # Position in the queue spread across all slots, times the typical service time
+        return (self._waiting + 1) / self.max_in_flight * self._avg_service
+
+    def _record_wait(self, waited: float):
+        self._admitted_total += 1
+        self._avg_wait += _EWMA_ALPHA * (waited - self._avg_wait)
+        self._max_wait = max(self._max_wait, waited)
+
+    def _reject(self, message: str, estimate: float):
+        self._rejected_total += 1
+        raise AdmissionRejected(message, retry_after=max(1, math.ceil(estimate)))
+
+    def _enqueue(self, key: str, max_wait: float, waiter: _Waiter):
+        """Take a free slot (returns None) or queue waiter, rejecting when the wait would be too long"""
+        with self._lock:
+            if self._in_flight < self.max_in_flight and self._waiting == 0:
+                self._in_flight += 1
+                self._record_wait(0.0)
+                return None
+
+            estimate = self._estimated_wait()
+            if max_wait is not None:
+                if self._waiting >= self.max_queue:
+                    self._reject(f"Server busy: {self._waiting} requests already waiting", estimate)
+                waiting_for_key = len(self._queues.get(key, ()))
+                if waiting_for_key >= self.max_queue_per_key:
+                    self._reject(f"Too many requests: {waiting_for_key} of yours are already waiting", estimate)
+                if estimate > max_wait:
+                    self._reject(f"Server busy: estimated wait {estimate:.0f}s exceeds {max_wait:.0f}s", estimate)
+
+            self._queues.setdefault(key, deque()).append(waiter)
+            self._waiting += 1
+            return waiter
+
+    def _withdraw(self, key: str, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; False if it was granted a slot in the meantime (caller must release it)"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            queue = self._queues.get(key)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[key]
+                self._waiting -= 1
+            return True
+
+    def _finish_wait(self, key: str, waiter: _Waiter, max_wait: float):
+        if self._withdraw(key, waiter):
+            with self._lock:
+                self._reject(f"Server busy: no slot within {max_wait:.0f}s", self._estimated_wait())
+        with self._lock:
+            self._record_wait(time.monotonic() - waiter.enqueued_at)
+
+    def acquire(self, key: str, max_wait: float = None):
+        """
+        Block until a slot is granted to key. max_wait=None waits indefinitely and
+        bypasses the queue limit (used by already-queued background jobs).
+        """
+        waiter = self._enqueue(key, max_wait, _Waiter())
+        if waiter is None:
+            return
+        waiter.event.wait(max_wait)
+        self._finish_wait(key, waiter, max_wait)
+
+    async def acquire_async(self, key: str, max_wait: float = None):
+        """
+        Same as acquire(), but waits on the event loop, so a full thread pool
+        cannot delay the decision to admit or reject a request.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enqueue(key, max_wait, _Waiter(wake=lambda: loop.call_soon_threadsafe(_resolve, future)))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away - hand back the slot if it was granted while we were cancelled
+            if not self._withdraw(key, waiter):
+                self.release()
+            raise
+        self._finish_wait(key, waiter, max_wait)
+
+    def release(self, service_time: float = None):
+        """Free a slot, handing it to the next waiter in round-robin order"""
+        with self._lock:
+            if service_time is not None:
+                self._avg_service += _EWMA_ALPHA * (service_time - self._avg_service)
+
+            if not self._queues:
+                self._in_flight -= 1
+                return
+
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._waiting -= 1
+
+            # The slot passes straight to the waiter, so in-flight stays the same
+            waiter.granted = True
+            waiter.wake()
+
+    @contextmanager
+    def slot(self, key: str, max_wait: float = None):
+        self.acquire(key, max_wait=max_wait)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(service_time=time.monotonic() - start_time)
+
+    @asynccontextmanager
+    async def slot_async(self, key: str, max_wait: float = None):
+        await self.acquire_async(key, max_wait=max_wait)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(service_time=time.monotonic() - start_time)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "max_queue_per_key": self.max_queue_per_key,
+                "waiting_keys": len(self._queues),
+                "admitted_total": self._admitted_total,
+                "rejected_total": self._rejected_total,
+                "average_wait_seconds": round(self._avg_wait, 3),
+                "max_wait_seconds": round(self._max_wait, 3),
+                "average_service_seconds": round(self._avg_service, 3),
+                "estimated_wait_seconds": round(self._estimated_wait(), 3)
+            }
+
+
+admission_controller = AdmissionController()
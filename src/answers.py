@@ -0,0 +1,144 @@
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+# Single rows with more columns than this are left to the LLM
+MAX_LOCAL_COLUMNS = 6
+
+# Column-name hints -> unit suffix appended to formatted numbers
+_UNIT_HINTS = [
+    (re.compile(r"(percent|pct)"), "%"),
+    (re.compile(r"(seconds|_secs?$|_sec_)"), " seconds"),
+    (re.compile(r"(minutes|_mins?$)"), " minutes"),
+    (re.compile(r"(hours|_hrs?$)"), " hours"),
+    (re.compile(r"(_days$|days_)"), " days"),
+]
+
+# Questions asking for interpretation rather than a figure always go to the LLM
+_NEEDS_NARRATIVE = re.compile(r"\b(why|explain|compare|comparison|insight|recommend|summari[sz]e|analy[sz]e)", re.IGNORECASE)
+
+# Aggregate expressions used as column names, e.g. COUNT(*) or AVG(resolution_time)
+_AGGREGATE = re.compile(r"^\s*(count|sum|avg|min|max)\s*\(\s*(distinct\s+)?([^)]*)\)\s*$", re.IGNORECASE)
+_AGGREGATE_WORDS = {"count": "number of", "sum": "total", "avg": "average", "min": "minimum", "max": "maximum"}
+
+# Abbreviations expanded in labels, and unit words dropped from labels once the unit is shown on the value
+_LABEL_WORDS = {"avg": "average", "cnt": "count", "num": "number of", "qty": "quantity", "pct": "percentage"}
+_UNIT_WORDS = {"seconds", "secs", "sec", "minutes", "mins", "hours", "hrs", "days", "percent", "pct", "in"}
+
+# "How many new users were there ...?" - the counted noun and the verb, reused in the answer
+_HOW_MANY_THERE = re.compile(r"\bhow many ([a-z][a-z -]*?) (are|were|is|was) there\b", re.IGNORECASE)
+
+
+def humanize_column(column: str) -> str:
+    """Turn a column name or aggregate expression into a readable label"""
+    match = _AGGREGATE.match(column)
+    if match:
+        func, distinct, arg = match.groups()
+        word = _AGGREGATE_WORDS[func.lower()]
+        arg = arg.strip().strip("`")
+        if arg in ("", "*", "1"):
+            return "count" if word == "number of" else word
+        label = humanize_column(arg.split(".")[-1])
+        if word == "number of":
+            # COUNT(DISTINCT user_id) -> "number of distinct users"
+            words = label.split()
+            if len(words) > 1 and words[-1] == "id":
+                words.pop()
+            if not words[-1].endswith("s"):
+                words[-1] += "s"
+            label = ("distinct " if distinct else "") + " ".join(words)
+        return f"{word} {label}"
+
+    label = column.strip("`").replace("_", " ")
+    label = re.sub(r"([a-z])([A-Z])", r"\1 \2", label)
+    words = [_LABEL_WORDS.get(word, word) for word in label.lower().split()]
+
+    # "resolution_time_seconds" reads as "resolution time", the value carries the unit
+    if _unit_for(column):
+        while len(words) > 1 and words[-1] in _UNIT_WORDS:
+            words.pop()
+    return " ".join(words)
+
+
+def _unit_for(column: str) -> str:
+    name = column.lower()
+    for pattern, unit in _UNIT_HINTS:
+        if pattern.search(name):
+            return unit
+    return ""
+
+
+def format_value(column: str, value) -> str:
+    """Format a single result value using the column name for units"""
+    if value is None:
+        return "no value"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, Decimal):
+        value = int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, int):
+        return f"{value:,}{_unit_for(column)}"
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return f"{int(value):,}{_unit_for(column)}"
+        return f"{value:,.2f}{_unit_for(column)}"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    return str(value)
+
+
+def _is_ambiguous(column: str, value) -> bool:
+    # A "percent" column holding 0.42 may be a ratio (42%) or a fraction of a percent
+    if isinstance(value, bool) or not isinstance(value, (int, float, Decimal)):
+        return False
+    return _unit_for(column) == "%" and 0 < abs(value) <= 1
+
+
+def _scalar_answer(user_question: str, column: str, value) -> str:
+    formatted = format_value(column, value)
+    match = _HOW_MANY_THERE.search(user_question or "")
+    # The counted noun is plural, so a count of one falls through to the label form
+    if match and isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) and value != 1:
+        noun, verb = match.groups()
+        verb = "were" if verb.lower() in ("were", "was") else "are"
+        return f"There {verb} **{formatted}** {noun.lower()}."
+    # "Label: value" reads correctly whether the label is singular or plural
+    return f"{humanize_column(column).capitalize()}: **{formatted}**."
+
+
+def synthesize_answer(user_question: str, columns, rows):
+    """
+    Build the natural language answer locally for trivial result shapes.
+
+    Handles empty results, a single scalar and a single short row. Returns None
+    for anything else, when the question asks for explanation, or when a value
+    cannot be phrased without guessing its unit, so the caller falls back to the LLM.
+    """
+    if _NEEDS_NARRATIVE.search(user_question or ""):
+        return None
+
+    if not rows:
+        return "No matching data was found for your question."
+
+    if len(rows) != 1 or not columns or len(columns) != len(rows[0]):
+        return None
+
+    row = rows[0]
+    if any(_is_ambiguous(column, value) for column, value in zip(columns, row)):
+        return None
+
+    if len(columns) == 1:
+        if row[0] is None:
+            return "No matching data was found for your question."
+        return _scalar_answer(user_question, columns[0], row[0])
+
+    if len(columns) > MAX_LOCAL_COLUMNS:
+        return None
+
+    lines = [f"- **{humanize_column(column).capitalize()}**: {format_value(column, value)}"
+             for column, value in zip(columns, row)]
+    return "Here is the result:\n" + "\n".join(lines)
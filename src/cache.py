@@ -0,0 +1,205 @@
+from dotenv import load_dotenv
+import hashlib
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+load_dotenv(override=True)
+
+# Cache backend configuration
+# memory - per-process LRU (default, fine for a single worker)
+# disk   - files under CACHE_DIR, shared by every worker process on the host
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "apmt_chatbot_cache"))
+
+# Disk entries are prefixed with their absolute expiry time (0 = never expires)
+_EXPIRY_HEADER = struct.Struct(">d")
+
+
+def _ensure_private_dir(path: str):
+    """
+    Make sure path is a real directory owned by this user and closed to everyone else.
+    The default CACHE_DIR lives in the shared temp directory, where another user
+    could otherwise pre-create it and plant entries.
+    """
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Cache directory {path} is not a directory")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"Cache directory {path} is owned by another user")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+
+
+class MemoryCache:
+    """Bounded, thread-safe LRU cache of bytes values with optional per-entry TTL"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        expires_at = time.time() + ttl if ttl else 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key: str, value: bytes, ttl: float = None) -> bool:
+        """Store value only if key is absent (or expired); returns whether it was stored"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not (entry[1] and entry[1] < time.time()):
+                return False
+            self._entries[key] = (value, time.time() + ttl if ttl else 0)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DiskCache:
+    """
+    Cache of bytes values stored as files, shared across worker processes.
+
+    Writes go to a temporary file followed by an atomic rename, so concurrent
+    workers never observe partial entries. Every prune_every writes the oldest
+    files are pruned once the directory has grown past max_entries, so frequent
+    overwrites (e.g. job progress) do not rescan the directory each time.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.prune_every = max(1, max_entries // 16)
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _ensure_private_dir(directory)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if len(data) < _EXPIRY_HEADER.size:
+            return None
+        (expires_at,) = _EXPIRY_HEADER.unpack_from(data)
+        if expires_at and expires_at < time.time():
+            self.delete(key)
+            return None
+        return data[_EXPIRY_HEADER.size:]
+
+    def _write_temp(self, value: bytes, ttl: float = None) -> str:
+        expires_at = time.time() + ttl if ttl else 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_EXPIRY_HEADER.pack(expires_at))
+                f.write(value)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        tmp_path = self._write_temp(value, ttl)
+        try:
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._written()
+
+    def add(self, key: str, value: bytes, ttl: float = None) -> bool:
+        """Store value only if key is absent (or expired); returns whether it was stored"""
+        tmp_path = self._write_temp(value, ttl)
+        try:
+            # link() fails if the target exists, so exactly one process wins the key
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, self._path(key))
+                    break
+                except FileExistsError:
+                    if self.get(key) is not None:
+                        return False
+                    # get() removed the expired entry, try once more
+            else:
+                return False
+        finally:
+            os.remove(tmp_path)
+        self._written()
+        return True
+
+    def _written(self):
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % self.prune_every == 0
+        if due:
+            self._prune()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _prune(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if not entry.name.startswith(".tmp-")]
+        except FileNotFoundError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+
+        # Another worker may delete files while we look at them
+        dated = []
+        for entry in entries:
+            try:
+                dated.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+        dated.sort()
+        for _, path in dated[:len(dated) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def get_cache(namespace: str, max_entries: int = 256):
+    """Return a cache for the given namespace using the configured CACHE_BACKEND"""
+    if CACHE_BACKEND == "disk":
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        _ensure_private_dir(CACHE_DIR)
+        return DiskCache(os.path.join(CACHE_DIR, namespace), max_entries=max_entries)
+    return MemoryCache(max_entries=max_entries)
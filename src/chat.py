@@ -2,12 +2,17 @@ from dotenv import load_dotenv
 import os
 import time
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import AzureChatOpenAI
-from .mysql import get_schema, run_query
-from .templates import SQL_GENERATION_TEMPLATE, NATURAL_LANGUAGE_RESPONSE_TEMPLATE
+from .mysql import get_schema, run_queries, format_results
+from .sqlguard import UnsafeQuery
+from .templates import (
+    SQL_GENERATION_SYSTEM_TEMPLATE, SQL_GENERATION_USER_TEMPLATE,
+    NATURAL_LANGUAGE_RESPONSE_SYSTEM_TEMPLATE, NATURAL_LANGUAGE_RESPONSE_USER_TEMPLATE
+)
 from .logger_config import log_transaction
 from .graphgenerator import generate_graph
+from .answers import synthesize_answer
+from .llm_usage import invoke_tracked
 
 load_dotenv(override=True)
 
@@ -27,9 +32,12 @@ llm = AzureChatOpenAI(
 ) if AZURE_OPENAI_API_KEY else None
 
 
+DML_MESSAGE = "**Security Notice**: Data modification operations are not allowed."
+
+
 def check_dml_guardrail(user_question: str, sql_query: str = None) -> tuple[bool, str]:
 
-    dml_message = "**Security Notice**: Data modification operations are not allowed."
+    dml_message = DML_MESSAGE
 
     # DML keywords that should be blocked
     dml_keywords = [
@@ -49,11 +57,16 @@ def check_dml_guardrail(user_question: str, sql_query: str = None) -> tuple[bool
     return True, ""
 
 
-def chat_with_sql(user_question: str, sql_system_prompt: str = None, response_system_prompt: str = None):
+def chat_with_sql(user_question: str, sql_system_prompt: str = None, response_system_prompt: str = None, progress=None):
+    """
+    Answer a question end to end: generate SQL, run it, describe the result and plot it.
+    progress(stage, **data) is called as partial results become available, if given.
+    """
     start_time = time.time()
     original_sql_query = None
     sql_query = None
     data_output = None
+    db_execution_time = None
     answer = None
     error = None
 
@@ -72,7 +85,11 @@ def chat_with_sql(user_question: str, sql_system_prompt: str = None, response_sy
             )
             return dml_error, None, None
         
-        prompt = ChatPromptTemplate.from_template(SQL_GENERATION_TEMPLATE)
+        # Static instructions and schema go in the system message so the provider can cache the prefix
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", SQL_GENERATION_SYSTEM_TEMPLATE),
+            ("human", SQL_GENERATION_USER_TEMPLATE)
+        ])
 
         # Get schema once
         schema = get_schema('_')
@@ -82,10 +99,13 @@ def chat_with_sql(user_question: str, sql_system_prompt: str = None, response_sy
             "schema": schema,
             "question": user_question
         }
-        original_sql_query = (prompt | llm.bind(stop=[";\n```"]) | StrOutputParser()).invoke(sql_prompt_data)
+        original_sql_query = invoke_tracked("SQL_GENERATION", prompt | llm.bind(stop=[";\n```"]), sql_prompt_data).content
         sql_query = original_sql_query.replace("sql", "").replace("```", "").strip()
 
-        prompt_response = ChatPromptTemplate.from_template(NATURAL_LANGUAGE_RESPONSE_TEMPLATE)
+        prompt_response = ChatPromptTemplate.from_messages([
+            ("system", NATURAL_LANGUAGE_RESPONSE_SYSTEM_TEMPLATE),
+            ("human", NATURAL_LANGUAGE_RESPONSE_USER_TEMPLATE)
+        ])
         
         # Second guardrail: Check the generated SQL query for DML operations
         is_safe, dml_error = check_dml_guardrail(user_question, sql_query)
@@ -98,18 +118,45 @@ def chat_with_sql(user_question: str, sql_system_prompt: str = None, response_sy
                 execution_time=time.time() - start_time
             )
             return dml_error, sql_query, None
-        
-        # Get SQL response (data output)  
-        data_output = run_query(sql_query)
 
-        # Get natural language answer using already obtained data
-        answer_prompt_data = {
-            "schema": schema,
-            "question": user_question,
-            "query": sql_query,
-            "response": data_output
-        }
-        answer = (prompt_response | llm | StrOutputParser()).invoke(answer_prompt_data)
+        if progress:
+            progress("sql_generated", sql_query=sql_query)
+        
+        # Get SQL response (data output) - one statement per data source, run in parallel
+        db_start_time = time.time()
+        try:
+            results = run_queries(sql_query)
+        except UnsafeQuery as unsafe:
+            # Third guardrail: every statement must be a single read-only SELECT (catches e.g. "...;DROP TABLE x")
+            dml_error = DML_MESSAGE
+            log_transaction(
+                transaction_type="DML_BLOCKED",
+                user_question=user_question,
+                sql_query=sql_query,
+                error=f"{dml_error} ({str(unsafe)})",
+                execution_time=time.time() - start_time
+            )
+            return dml_error, sql_query, None
+        db_execution_time = time.time() - db_start_time
+        data_output = format_results(results)
+
+        # Empty, scalar and single-row results are answered locally without an LLM call
+        answer = None
+        if len(results) == 1:
+            _, columns, rows = results[0]
+            answer = synthesize_answer(user_question, columns, rows)
+        if answer is None:
+            # Get natural language answer using already obtained data
+            answer_prompt_data = {
+                "schema": schema,
+                "question": user_question,
+                "query": sql_query,
+                "response": data_output
+            }
+            answer = invoke_tracked("NATURAL_LANGUAGE_RESPONSE", prompt_response | llm, answer_prompt_data).content
+
+        if progress:
+            progress("answer_ready", answer=answer)
 
         # Attempt graph generation without failing entire chat on error
         fig = None
@@ -133,10 +180,11 @@ def chat_with_sql(user_question: str, sql_system_prompt: str = None, response_sy
             sql_query=sql_query,
             data_output=data_output,
             answer=answer,
-            execution_time=execution_time
+            execution_time=execution_time,
+            db_execution_time=db_execution_time
         )
 
-        return answer, sql_query, fig.to_json()
+        return answer, sql_query, fig
         
     except Exception as e:
         execution_time = time.time() - start_time
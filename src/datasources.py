@@ -0,0 +1,188 @@
+from dotenv import load_dotenv
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from .rollups import ROLLUP_TABLE_PREFIX, RollupCatalog
+from .sqlguard import referenced_tables
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Datasource configuration
+# DATASOURCES is a JSON object: {"<name>": {"uri": "...", "replicas": ["...", ...], "rollup_uri": "..."}, ...}
+# Without it a single "default" source is built from db_uri (+ optional comma-separated DB_REPLICA_URIS
+# and ROLLUP_DB_URI). rollup_uri is the same database with an account allowed to create rollup tables.
+DATASOURCES = os.getenv("DATASOURCES")
+DB_REPLICA_URIS = os.getenv("DB_REPLICA_URIS", "")
+DATASOURCE_POOL_SIZE = int(os.getenv("DATASOURCE_POOL_SIZE", "5"))
+DATASOURCE_MAX_OVERFLOW = int(os.getenv("DATASOURCE_MAX_OVERFLOW", "10"))
+DATASOURCE_HEALTH_INTERVAL = int(os.getenv("DATASOURCE_HEALTH_INTERVAL", "30"))  # seconds between replica checks
+DATASOURCE_PARALLELISM = int(os.getenv("DATASOURCE_PARALLELISM", "4"))
+SCHEMA_SNAPSHOT_TTL = int(os.getenv("SCHEMA_SNAPSHOT_TTL", "600"))
+
+def _create_engine(uri: str):
+    return create_engine(
+        uri,
+        pool_size=DATASOURCE_POOL_SIZE,
+        max_overflow=DATASOURCE_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600
+    )
+
+
+class EndpointUnavailable(Exception):
+    """Raised when no connection to an endpoint could be opened"""
+
+
+class Endpoint:
+    """One database server (primary or replica) with its own connection pool"""
+
+    def __init__(self, uri: str):
+        self.engine = _create_engine(uri)
+        self.healthy = True
+
+    def execute(self, query: str):
+        try:
+            connection = self.engine.connect()
+        except SQLAlchemyError as e:
+            raise EndpointUnavailable(str(e)) from e
+        with connection:
+            result = connection.execute(text(query))
+            columns = list(result.keys())
+            rows = [tuple(row) for row in result.fetchall()]
+        return columns, rows
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            self.healthy = True
+        except Exception:
+            self.healthy = False
+        return self.healthy
+
+
+class DataSource:
+    """
+    A named database: primary for schema and fallback reads, optional replicas
+    that take the read load round-robin while they pass health checks.
+    """
+
+    def __init__(self, name: str, uri: str, replicas=(), rollup_uri: str = None):
+        self.name = name
+        self.primary = Endpoint(uri)
+        self.replicas = [Endpoint(replica) for replica in replicas]
+        self.rollup_uri = rollup_uri
+        self.rollups = RollupCatalog(self.primary.engine)
+        self._round_robin = itertools.count()
+        self._schema = None
+        self._schema_at = 0.0
+        self._schema_lock = threading.Lock()
+        self._reflect()
+
+    def _reflect(self):
+        # SQLDatabase reflects tables once, so a fresh one is needed to see tables added since
+        self.db = SQLDatabase(self.primary.engine)
+        # Rollup tables are an internal cache, keep them out of the prompt and the routing table
+        self.tables = [name for name in self.db.get_usable_table_names() if not name.startswith(ROLLUP_TABLE_PREFIX)]
+
+    def schema(self) -> str:
+        """
+        Schema snapshot (table DDL and sample rows), rebuilt at most every SCHEMA_SNAPSHOT_TTL seconds.
+        The table list used for routing is refreshed at the same time.
+        """
+        with self._schema_lock:
+            if self._schema is None or time.time() - self._schema_at > SCHEMA_SNAPSHOT_TTL:
+                if self._schema is not None:
+                    self._reflect()
+                self._schema = self.db.get_table_info(table_names=self.tables)
+                self._schema_at = time.time()
+            return self._schema
+
+    def read_endpoint(self) -> Endpoint:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def execute(self, query: str):
+        endpoint = self.read_endpoint()
+        try:
+            return endpoint.execute(query)
+        except (EndpointUnavailable, DBAPIError) as e:
+            # A replica that refuses or drops connections is taken out of rotation until the next health check
+            if endpoint is self.primary or not (isinstance(e, EndpointUnavailable) or e.connection_invalidated):
+                raise
+            logger.warning(f"Replica of data source '{self.name}' failed, retrying on primary: {str(e)}")
+            endpoint.healthy = False
+            return self.primary.execute(query)
+
+    def check_replicas(self):
+        for replica in self.replicas:
+            replica.check()
+
+
+class DataSourceRegistry:
+    """Named data sources, with queries routed to the source that owns the tables they reference"""
+
+    def __init__(self, sources):
+        self.sources = OrderedDict((source.name, source) for source in sources)
+        self.default = next(iter(self.sources.values()))
+        self._executor = ThreadPoolExecutor(max_workers=DATASOURCE_PARALLELISM, thread_name_prefix="datasource")
+        if any(source.replicas for source in self.sources.values()):
+            threading.Thread(target=self._health_loop, name="datasource-health", daemon=True).start()
+
+    @classmethod
+    def from_env(cls, db_uri: str):
+        if DATASOURCES:
+            config = json.loads(DATASOURCES)
+            return cls([
+                DataSource(name, spec["uri"], spec.get("replicas", []), spec.get("rollup_uri"))
+                for name, spec in config.items()
+            ])
+        replicas = [uri.strip() for uri in DB_REPLICA_URIS.split(",") if uri.strip()]
+        return cls([DataSource("default", db_uri, replicas, os.getenv("ROLLUP_DB_URI"))])
+
+    def _health_loop(self):
+        while True:
+            time.sleep(DATASOURCE_HEALTH_INTERVAL)
+            for source in self.sources.values():
+                source.check_replicas()
+
+    def schema(self) -> str:
+        """Combined schema; with several sources each one gets its own labelled section"""
+        if len(self.sources) == 1:
+            return self.default.schema()
+        return "\n\n".join(f"-- Data source: {name}\n{source.schema()}" for name, source in self.sources.items())
+
+    def _owners(self) -> dict:
+        # Built from the current table lists, which follow each source's schema snapshot
+        owners = {}
+        for source in self.sources.values():
+            for table in source.tables:
+                owners.setdefault(table.lower(), source)
+        return owners
+
+    def route(self, sql: str) -> DataSource:
+        """The source owning every known table referenced by sql (the default source if none are known)"""
+        owners_by_table = self._owners()
+        owners = {owners_by_table[table] for table in referenced_tables(sql) if table in owners_by_table}
+        if len(owners) > 1:
+            names = ", ".join(sorted(source.name for source in owners))
+            raise ValueError(f"Query joins tables from different data sources ({names}); write one query per data source instead")
+        return owners.pop() if owners else self.default
+
+    def map(self, func, statements):
+        """Run func over statements, in parallel when there is more than one"""
+        if len(statements) == 1:
+            return [func(statements[0])]
+        return list(self._executor.map(func, statements))
@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import json
+
+import numpy as np
+
+# Plotly.js typed-array dtypes (https://plotly.com/javascript/reference/ - "bdata")
+# There is no 64-bit integer type, so large integers fall back to float64.
+_INT32_MIN, _INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+# Arrays shorter than this are left as plain JSON lists - base64 only pays off on larger traces
+MIN_TYPED_ARRAY_LENGTH = 8
+
+
+def _to_typed_array(value):
+    """Return a Plotly typed-array spec for a numeric list/ndarray, or None if not numeric"""
+    try:
+        arr = np.asarray(value)
+    except Exception:
+        return None
+
+    if arr.size < MIN_TYPED_ARRAY_LENGTH or arr.ndim > 2:
+        return None
+
+    if arr.dtype.kind in ("i", "u"):
+        if arr.min() >= _INT32_MIN and arr.max() <= _INT32_MAX:
+            arr, dtype = arr.astype("<i4"), "i4"
+        else:
+            arr, dtype = arr.astype("<f8"), "f8"
+    elif arr.dtype.kind == "f":
+        arr, dtype = arr.astype("<f8"), "f8"
+    else:
+        # strings, dates, booleans, mixed/object arrays stay as regular JSON
+        return None
+
+    spec = {"dtype": dtype, "bdata": base64.b64encode(np.ascontiguousarray(arr).tobytes()).decode("ascii")}
+    if arr.ndim == 2:
+        spec["shape"] = f"{arr.shape[0]},{arr.shape[1]}"
+    return spec
+
+
+def _encode_arrays(obj):
+    """Recursively replace numeric arrays inside a trace dict with typed-array specs"""
+    if isinstance(obj, dict):
+        return {key: _encode_arrays(val) for key, val in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        spec = _to_typed_array(obj)
+        if spec is not None:
+            return spec
+        if isinstance(obj, np.ndarray):
+            return obj
+        return [_encode_arrays(val) for val in obj]
+    return obj
+
+
+def _decode_arrays(obj):
+    """Inverse of _encode_arrays - turn typed-array specs back into numpy arrays"""
+    if isinstance(obj, dict):
+        if "bdata" in obj and "dtype" in obj:
+            arr = np.frombuffer(base64.b64decode(obj["bdata"]), dtype="<" + obj["dtype"])
+            if "shape" in obj:
+                arr = arr.reshape([int(dim) for dim in str(obj["shape"]).split(",")])
+            return arr
+        return {key: _decode_arrays(val) for key, val in obj.items()}
+    if isinstance(obj, list):
+        return [_decode_arrays(val) for val in obj]
+    return obj
+
+
+def encode_figure(fig) -> bytes:
+    """
+    Serialize a Plotly figure to compact JSON bytes exactly once.
+
+    Numeric trace arrays are written using Plotly's base64 typed-array encoding,
+    which plotly.js renders natively and which is far smaller than decimal text.
+    """
+    from plotly.utils import PlotlyJSONEncoder
+
+    fig_dict = fig.to_plotly_json()
+    fig_dict["data"] = [_encode_arrays(trace) for trace in fig_dict.get("data", [])]
+    return json.dumps(fig_dict, cls=PlotlyJSONEncoder, separators=(",", ":")).encode("utf-8")
+
+
+def decode_figure(payload):
+    """Build a plotly Figure from bytes/str produced by encode_figure"""
+    import plotly.graph_objects as go
+
+    fig_dict = _decode_arrays(json.loads(payload))
+    return go.Figure(fig_dict)
+
+
+def figure_id(payload: bytes) -> str:
+    """Content address of an encoded figure"""
+    return hashlib.sha256(payload).hexdigest()[:32]
+
@@ -6,8 +6,9 @@ import plotly.graph_objects as go
 import pandas as pd
 from langchain_openai import AzureChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from .templates import GRAPH_GENERATION_TEMPLATE
+from .templates import GRAPH_GENERATION_SYSTEM_TEMPLATE, GRAPH_GENERATION_USER_TEMPLATE, GRAPH_GENERATION_RETRY_TEMPLATE
 from .logger_config import log_transaction
+from .llm_usage import invoke_tracked
 
 
 load_dotenv(override=True)
@@ -39,22 +40,22 @@ def generate_graph(response: str, user_question: str = None):
     
     for attempt in range(max_retries):
         try:
-            prompt = ChatPromptTemplate.from_template(GRAPH_GENERATION_TEMPLATE)
+            # Static instructions first (cacheable prefix), then the question and data
+            messages = [
+                ("system", GRAPH_GENERATION_SYSTEM_TEMPLATE),
+                ("human", GRAPH_GENERATION_USER_TEMPLATE)
+            ]
+            invoke_params = {"query": response, "user_question": user_question or ""}
                 
-            llm_chain = prompt | llm.bind(stop=["\n```"])
-            
-            # Pass both user_question and query to the prompt
-            invoke_params = {"query": response}
-            if user_question:
-                invoke_params["user_question"] = user_question
-                
-            # If retrying, add error context to help the LLM fix the issue
+            # If retrying, add error context as a follow-up message to help the LLM fix the issue
             if attempt > 0 and error:
-                retry_template = GRAPH_GENERATION_TEMPLATE + f"\n\nPrevious attempt failed with error: {error}. Please fix the code."
-                prompt = ChatPromptTemplate.from_template(retry_template)
-                llm_chain = prompt | llm.bind(stop=["\n```"])
+                messages.append(("human", GRAPH_GENERATION_RETRY_TEMPLATE))
+                invoke_params["error"] = error
+
+            prompt = ChatPromptTemplate.from_messages(messages)
+            llm_chain = prompt | llm.bind(stop=["\n```"])
                 
-            code = llm_chain.invoke(invoke_params).content
+            code = invoke_tracked("GRAPH_GENERATION", llm_chain, invoke_params).content
 
             # Provide plotly and pandas imports in execution environment
             local_vars = {"px": px, "go": go, "pd": pd}
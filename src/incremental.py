@@ -0,0 +1,382 @@
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from .cache import get_cache
+from .sqlguard import referenced_tables
+
+load_dotenv(override=True)
+
+# Only queries that read nothing but these tables are cached (comma-separated, empty = disabled).
+# List append-only tables only: rows that change after they are written (ticket status, resolution...)
+# would leave sealed days stale.
+INCREMENTAL_TABLES = {name.strip().lower() for name in os.getenv("INCREMENTAL_TABLES", "").split(",") if name.strip()}
+# Buckets older than this many days are considered final and are never re-queried
+INCREMENTAL_SEAL_LAG_DAYS = int(os.getenv("INCREMENTAL_SEAL_LAG_DAYS", "1"))
+INCREMENTAL_CACHE_TTL = int(os.getenv("INCREMENTAL_CACHE_TTL", str(7 * 24 * 3600)))
+
+_CLAUSES = re.compile(
+    r"\b(select|from|where|group\s+by|having|order\s+by|limit|union|with|over|window|into|for\s+update)\b",
+    re.IGNORECASE
+)
+_BUCKET_EXPR = re.compile(r"^date\s*\(\s*(?P<column>[\w.`]+)\s*\)$", re.IGNORECASE)
+_ALIAS = re.compile(r"^(?P<expr>.*?)(?:\s+as)?\s+(?P<alias>`[^`]+`|\w+)$", re.IGNORECASE | re.DOTALL)
+_ORDER_ITEM = re.compile(r"^(?P<expr>.*?)(?:\s+(?P<direction>asc|desc))?$", re.IGNORECASE | re.DOTALL)
+_RELATIVE_TIME = re.compile(r"\b(curdate|current_date|now|current_timestamp|sysdate|utc_date|utc_timestamp)\b", re.IGNORECASE)
+# Relative bounds must fall on midnight, or the first day of the window would only be partly covered
+_DATE_ALIGNED_TIME = re.compile(r"\b(curdate|current_date|utc_date)\b", re.IGNORECASE)
+_SUB_DAY_UNIT = re.compile(r"\b(hour|minute|second|microsecond|hour_\w+|minute_\w+|second_\w+|day_\w+)\b", re.IGNORECASE)
+_STRING_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`")
+_TOP_LEVEL_AND = re.compile(r"\band\b", re.IGNORECASE)
+_TOP_LEVEL_OR = re.compile(r"\b(or|xor)\b|\|\|", re.IGNORECASE)
+_RANGE_PREDICATE = re.compile(r"^(?P<lhs>.+?)\s*(?:>=|<=|>|<)\s*(?P<rhs>.+)$", re.DOTALL)
+# Anything that makes one bucket depend on another (or truncates the result) disables incremental refresh
+_UNSUPPORTED = ("limit", "union", "with", "over", "window", "into", "for update")
+
+
+def _mask(sql: str, parentheses: bool = True) -> str:
+    """
+    Blank out string literals and everything inside parentheses so only top-level SQL remains.
+    With parentheses=False only string literals are blanked.
+    """
+    if not parentheses:
+        return _STRING_LITERALS.sub(lambda match: " " * len(match.group(0)), sql)
+    masked = []
+    depth = 0
+    quote = None
+    for char in sql:
+        if quote:
+            masked.append(" ")
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            quote = char
+            masked.append(" ")
+        elif char == "(":
+            depth += 1
+            masked.append(" ")
+        elif char == ")":
+            depth -= 1
+            masked.append(" ")
+        else:
+            masked.append(char if depth == 0 else " ")
+    return "".join(masked)
+
+
+def _split_top_level(text: str):
+    """Split on commas that are not inside parentheses or quotes"""
+    masked = _mask(text)
+    items, start = [], 0
+    for i, char in enumerate(masked):
+        if char == ",":
+            items.append(text[start:i].strip())
+            start = i + 1
+    items.append(text[start:].strip())
+    return items
+
+
+def _normalize(expr: str) -> str:
+    return re.sub(r"\s+", "", expr).replace("`", "").lower()
+
+
+def _relative_time_is_bucket_range(sql: str, clauses: dict, column: str) -> bool:
+    """
+    True when every relative-time reference (NOW(), CURDATE(), ...) is a
+    midnight-aligned range bound on the bucket column in a top-level WHERE
+    conjunct, e.g. created_at >= CURDATE() - INTERVAL 7 DAY. Such a bound only
+    adds or drops whole days. A NOW()-based bound cuts the first day of the
+    window partway, and a bound anywhere else (another column, JOIN ON, HAVING,
+    the select list) can change days already cached.
+    """
+    references = [match.start() for match in _RELATIVE_TIME.finditer(_mask(sql, parentheses=False))]
+    if not references:
+        return True
+    if "where" not in clauses:
+        return False
+
+    where_start = clauses["where"][1]
+    following = [pos for pos, _ in clauses.values() if pos > where_start]
+    where_end = min(following) if following else len(sql)
+    where = sql[where_start:where_end]
+    if any(not where_start <= position < where_end for position in references):
+        return False
+
+    masked = _mask(where)
+    if _TOP_LEVEL_OR.search(masked):
+        return False
+
+    bucket_sides = (_normalize(column), _normalize(f"DATE({column})"))
+    start = 0
+    for boundary in [match.start() for match in _TOP_LEVEL_AND.finditer(masked)] + [len(where)]:
+        conjunct = where[start:boundary].strip()
+        start = boundary + 3
+        if not _RELATIVE_TIME.search(_mask(conjunct, parentheses=False)):
+            continue
+        match = _RANGE_PREDICATE.match(conjunct)
+        if match is None or match.group("rhs").startswith((">", "=")):
+            return False
+        if _normalize(match.group("lhs")) not in bucket_sides:
+            return False
+        rhs = _mask(match.group("rhs"), parentheses=False)
+        if any(not _DATE_ALIGNED_TIME.fullmatch(reference.group(0)) for reference in _RELATIVE_TIME.finditer(rhs)):
+            return False
+        if _SUB_DAY_UNIT.search(rhs):
+            return False
+    return True
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    return None
+
+
+def _json_default(value):
+    # Types a DB driver returns that JSON has no native form for; datetime before date (it is a subclass)
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__type__": "decimal", "value": str(value)}
+    if isinstance(value, timedelta):
+        return {"__type__": "timedelta", "value": value.total_seconds()}
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+_JSON_DECODERS = {
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "decimal": Decimal,
+    "timedelta": lambda seconds: timedelta(seconds=seconds),
+}
+
+
+def _json_object(obj):
+    if "__type__" in obj:
+        return _JSON_DECODERS[obj["__type__"]](obj["value"])
+    return obj
+
+
+def _dump_entry(columns, buckets, sealed_before: date) -> bytes:
+    entry = {
+        "columns": columns,
+        "buckets": {bucket.isoformat(): [list(row) for row in rows] for bucket, rows in buckets.items()},
+        "sealed_before": sealed_before.isoformat()
+    }
+    return json.dumps(entry, default=_json_default).encode("utf-8")
+
+
+def _load_entry(payload: bytes):
+    entry = json.loads(payload, object_hook=_json_object)
+    return {
+        "columns": entry["columns"],
+        "buckets": {date.fromisoformat(bucket): [tuple(row) for row in rows] for bucket, rows in entry["buckets"].items()},
+        "sealed_before": date.fromisoformat(entry["sealed_before"])
+    }
+
+
+class TimeBucketQuery:
+    """
+    A single SELECT that groups by DATE(<column>).
+
+    Each output row only depends on the source rows of its own day, so results
+    for past days can be cached and only recent days need to be re-queried.
+    """
+
+    def __init__(self, sql, column, bucket_index, clauses, descending, sliding):
+        self.sql = sql
+        self.column = column
+        self.bucket_index = bucket_index
+        self.clauses = clauses
+        self.descending = descending
+        self.sliding = sliding
+
+    @classmethod
+    def parse(cls, sql: str):
+        """Return a TimeBucketQuery, or None if the query is not a supported time-bucketed aggregate"""
+        sql = sql.strip().rstrip(";").strip()
+        masked = _mask(sql)
+
+        clauses = {}
+        for match in _CLAUSES.finditer(masked):
+            keyword = re.sub(r"\s+", " ", match.group(1).lower())
+            if keyword in _UNSUPPORTED or keyword in clauses:
+                return None
+            clauses[keyword] = (match.start(), match.end())
+
+        if "select" not in clauses or clauses["select"][0] != 0 or "from" not in clauses or "group by" not in clauses:
+            return None
+
+        def segment(keyword):
+            start = clauses[keyword][1]
+            following = [pos for pos, _ in clauses.values() if pos > start]
+            return sql[start:min(following) if following else len(sql)].strip()
+
+        # Find DATE(column) in the select list
+        select_items = _split_top_level(segment("select"))
+        column = bucket_index = alias = None
+        for index, item in enumerate(select_items):
+            match = _ALIAS.match(item)
+            expr, item_alias = (match.group("expr"), match.group("alias")) if match and match.group("expr").strip() else (item, None)
+            bucket = _BUCKET_EXPR.match(expr.strip())
+            if bucket:
+                column, bucket_index, alias = bucket.group("column"), index, item_alias
+                break
+        if column is None:
+            return None
+
+        def is_bucket(expr):
+            expr = _normalize(expr)
+            return expr in (_normalize(f"DATE({column})"), _normalize(alias or ""), str(bucket_index + 1))
+
+        if not any(is_bucket(item) for item in _split_top_level(segment("group by"))):
+            return None
+
+        # Result order must be by bucket (or unspecified) so merged rows can be re-sorted
+        descending = False
+        if "order by" in clauses:
+            order_items = _split_top_level(segment("order by"))
+            match = _ORDER_ITEM.match(order_items[0])
+            if not is_bucket(match.group("expr")):
+                return None
+            descending = (match.group("direction") or "").lower() == "desc"
+
+        if not _relative_time_is_bucket_range(sql, clauses, column):
+            return None
+        sliding = bool(_RELATIVE_TIME.search(_mask(sql, parentheses=False)))
+        return cls(sql, column, bucket_index, clauses, descending, sliding)
+
+    def _where_and(self, predicate: str) -> str:
+        """Return the query with predicate ANDed into its top-level WHERE clause"""
+        if "where" in self.clauses:
+            where_start, where_end = self.clauses["where"]
+            group_start = self.clauses["group by"][0]
+            condition = self.sql[where_end:group_start].strip()
+            return f"{self.sql[:where_start]}WHERE ({condition}) AND {predicate} {self.sql[group_start:]}"
+        group_start = self.clauses["group by"][0]
+        return f"{self.sql[:group_start]}WHERE {predicate} {self.sql[group_start:]}"
+
+    def delta_query(self, since: date) -> str:
+        """The original query restricted to buckets on or after since (sargable on the raw column)"""
+        return self._where_and(f"{self.column} >= '{since.isoformat()}'")
+
+    def window_start_query(self) -> str:
+        """Cheap query for the first bucket that still falls inside a sliding window"""
+        from_start = self.clauses["from"][0]
+        group_start = self.clauses["group by"][0]
+        return f"SELECT MIN(DATE({self.column})) {self.sql[from_start:group_start]}"
+
+
+class IncrementalResultCache:
+    """Caches per-bucket rows of time-bucketed queries and merges fresh buckets on repeat runs"""
+
+    def __init__(self, seal_lag_days: int = INCREMENTAL_SEAL_LAG_DAYS, ttl: int = INCREMENTAL_CACHE_TTL,
+                 tables=INCREMENTAL_TABLES):
+        self.tables = {table.lower() for table in tables}
+        self.seal_lag_days = seal_lag_days
+        self.ttl = ttl
+        self._store = get_cache("incremental", max_entries=512)
+
+    @staticmethod
+    def _key(sql: str) -> str:
+        return hashlib.sha256(re.sub(r"\s+", " ", sql.strip().rstrip(";")).encode("utf-8")).hexdigest()
+
+    def _cacheable(self, sql: str) -> bool:
+        # Past days are only final when every table the query reads is append-only
+        tables = referenced_tables(sql)
+        return bool(tables) and tables <= self.tables
+
+    def _sealed_before(self) -> date:
+        return date.today() - timedelta(days=self.seal_lag_days)
+
+    def _save(self, key, columns, buckets):
+        try:
+            payload = _dump_entry(columns, buckets, self._sealed_before())
+        except TypeError:
+            # A column type we cannot serialise - leave the query uncached
+            self._store.delete(key)
+            return
+        self._store.set(key, payload, ttl=self.ttl)
+
+    def _load(self, key):
+        payload = self._store.get(key)
+        if payload is None:
+            return None
+        try:
+            return _load_entry(payload)
+        except (ValueError, KeyError, TypeError):
+            # Unreadable or from an older format - start over
+            self._store.delete(key)
+            return None
+
+    def _rows(self, query, buckets):
+        rows = []
+        for bucket in sorted(buckets, reverse=query.descending):
+            rows.extend(buckets[bucket])
+        return rows
+
+    def _group(self, query, rows):
+        buckets = {}
+        for row in rows:
+            bucket = _to_date(row[query.bucket_index])
+            if bucket is None:
+                return None
+            buckets.setdefault(bucket, []).append(row)
+        return buckets
+
+    def run(self, sql: str, execute):
+        """
+        Run sql through execute(sql) -> (columns, rows), reusing cached sealed buckets when possible.
+        Queries that are not time-bucketed aggregates over append-only tables (INCREMENTAL_TABLES)
+        are passed straight through.
+        """
+        query = TimeBucketQuery.parse(sql)
+        if query is None or not self._cacheable(sql):
+            return execute(sql)
+
+        key = self._key(query.sql)
+        entry = self._load(key)
+
+        if entry is None:
+            columns, rows = execute(sql)
+            buckets = self._group(query, rows)
+            if buckets is not None:
+                self._save(key, columns, buckets)
+            return columns, rows
+
+        # Re-query only the buckets that were still open when the entry was cached
+        since = entry["sealed_before"]
+        columns, delta_rows = execute(query.delta_query(since))
+        delta = self._group(query, delta_rows)
+        if delta is None or columns != entry["columns"]:
+            self._store.delete(key)
+            return execute(sql)
+
+        buckets = {bucket: rows for bucket, rows in entry["buckets"].items() if bucket < since}
+        buckets.update(delta)
+
+        # Drop history that has slid out of a relative window (e.g. "last 2 weeks")
+        if query.sliding and buckets:
+            _, bound_rows = execute(query.window_start_query())
+            window_start = _to_date(bound_rows[0][0]) if bound_rows else None
+            if window_start is None:
+                buckets = {}
+            else:
+                buckets = {bucket: rows for bucket, rows in buckets.items() if bucket >= window_start}
+
+        self._save(key, columns, buckets)
+        return columns, self._rows(query, buckets)
+
+
+incremental_cache = IncrementalResultCache()
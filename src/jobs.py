@@ -0,0 +1,229 @@
+from dotenv import load_dotenv
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from .cache import get_cache
+from .logger_config import log_transaction
+
+load_dotenv(override=True)
+
+# Job worker configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_QUEUE_PER_KEY = int(os.getenv("JOB_QUEUE_PER_KEY", "8"))  # waiting jobs allowed per user/session
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "900"))     # seconds finished jobs are kept
+JOB_MAX_RUNTIME = int(os.getenv("JOB_MAX_RUNTIME", "3600"))  # seconds before a queued/running record expires
+JOB_DRAIN_TIMEOUT = int(os.getenv("JOB_DRAIN_TIMEOUT", "300"))  # seconds to wait for jobs on shutdown
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+class JobQueueFull(Exception):
+    """Raised when the bounded job queue cannot accept another job"""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request"""
+
+
+class _FairQueue:
+    """
+    Bounded job queue with one FIFO per key (user or session), served
+    round-robin so one client's burst cannot hold up everyone else's jobs.
+    """
+
+    def __init__(self, maxsize: int, per_key: int):
+        self.maxsize = maxsize
+        self.per_key = per_key
+        self.unfinished_tasks = 0
+        self._queues = OrderedDict()  # key -> deque of items, in round-robin order
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def put_nowait(self, key: str, item):
+        with self._condition:
+            if self._size >= self.maxsize:
+                raise JobQueueFull(f"Job queue is full ({self._size} jobs waiting)")
+            queue = self._queues.setdefault(key, deque())
+            if len(queue) >= self.per_key:
+                raise JobQueueFull(f"Too many queued jobs for this client ({len(queue)} waiting)")
+            queue.append(item)
+            self._size += 1
+            self.unfinished_tasks += 1
+            self._condition.notify()
+
+    def get(self):
+        with self._condition:
+            while not self._queues:
+                self._condition.wait()
+            key, queue = next(iter(self._queues.items()))
+            item = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._size -= 1
+            return item
+
+    def task_done(self):
+        with self._condition:
+            self.unfinished_tasks -= 1
+
+    def qsize(self) -> int:
+        with self._condition:
+            return self._size
+
+
+class JobManager:
+    """
+    Runs chat jobs on a fixed pool of worker threads fed by a bounded,
+    per-key round-robin queue.
+
+    Job records are kept in the shared cache, so any worker process can answer
+    status polls when CACHE_BACKEND=disk, and finished results stay available
+    for JOB_RESULT_TTL seconds.
+    """
+
+    def __init__(self, handler, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE,
+                 per_key: int = JOB_QUEUE_PER_KEY, result_ttl: int = JOB_RESULT_TTL, max_runtime: int = JOB_MAX_RUNTIME):
+        # handler(payload: dict, progress: callable) -> dict (JSON-serialisable result)
+        self.handler = handler
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.max_runtime = max_runtime
+        self._queue = _FairQueue(max_queue, per_key)
+        self._store = get_cache("jobs", max_entries=4096)
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads are started lazily so importing the app (e.g. uvicorn --reload) stays cheap
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"chat-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _ttl(self, job: dict) -> int:
+        return self.result_ttl if job["status"] in FINISHED_STATES else self.max_runtime
+
+    def _save(self, job: dict):
+        job["updated_at"] = datetime.now().isoformat()
+        self._store.set(job["job_id"], json.dumps(job).encode("utf-8"), ttl=self._ttl(job))
+
+    def get(self, job_id: str):
+        payload = self._store.get(job_id)
+        return json.loads(payload) if payload is not None else None
+
+    def submit(self, payload: dict, key: str = "anonymous", idempotency_key: str = None) -> dict:
+        """
+        Queue a job under key (user or session) and return its record.
+        Resubmitting the same payload with the same idempotency key returns the existing job;
+        idempotency keys are scoped to key, and reusing one for another payload raises IdempotencyConflict.
+        """
+        payload_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        if idempotency_key:
+            job_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"chat-job:{key}:{idempotency_key}"))
+        else:
+            job_id = str(uuid.uuid4())
+
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "payload_hash": payload_hash,
+            "created_at": now,
+            "updated_at": now,
+            "partial": {},
+            "result": None,
+            "error": None
+        }
+
+        self._ensure_started()
+        if idempotency_key:
+            # Claim the id atomically, so concurrent retries with the same key queue the job only once
+            if not self._store.add(job_id, json.dumps(job).encode("utf-8"), ttl=self._ttl(job)):
+                existing = self.get(job_id)
+                if existing is not None and existing.get("payload_hash") != payload_hash:
+                    raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+                if existing is not None and existing["status"] != FAILED:
+                    return existing
+                self._save(job)
+        else:
+            self._save(job)
+        try:
+            self._queue.put_nowait(key, (job_id, payload))
+        except JobQueueFull:
+            self._store.delete(job_id)
+            raise
+        return job
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def drain(self, timeout: float):
+        """Block until queued and running jobs have finished, or timeout seconds have passed"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.5)
+        return self._queue.unfinished_tasks == 0
+
+    async def wait(self, job_id: str, timeout: float, poll_interval: float = 0.5):
+        """Long-poll: return the job once it has finished or changed, or after timeout seconds"""
+        job = self.get(job_id)
+        if job is None or timeout <= 0 or job["status"] in FINISHED_STATES:
+            return job
+
+        deadline = time.monotonic() + timeout
+        seen = (job["status"], job["updated_at"])
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            job = self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES or (job["status"], job["updated_at"]) != seen:
+                return job
+        return job
+
+    def _worker(self):
+        while True:
+            job_id, payload = self._queue.get()
+            try:
+                self._run(job_id, payload)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str, payload: dict):
+        start_time = time.time()
+        job = self.get(job_id)
+        if job is None:
+            return
+
+        job["status"] = RUNNING
+        self._save(job)
+
+        def progress(stage, **data):
+            job["partial"].update(data)
+            job["partial"]["stage"] = stage
+            self._save(job)
+
+        try:
+            job["result"] = self.handler(payload, progress)
+            job["status"] = SUCCEEDED
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = FAILED
+            log_transaction(
+                transaction_type="CHAT_JOB_ERROR",
+                user_question=payload.get("question"),
+                error=str(e),
+                execution_time=time.time() - start_time
+            )
+        self._save(job)
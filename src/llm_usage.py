@@ -0,0 +1,72 @@
+import threading
+import time
+from .logger_config import log_llm_usage
+
+
+def token_counts(message):
+    """Return (prompt_tokens, cached_tokens, completion_tokens) reported for an LLM response message"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens")
+    completion_tokens = usage.get("output_tokens")
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+
+    # Older langchain-openai versions only expose the raw OpenAI usage block
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    if prompt_tokens is None:
+        prompt_tokens = token_usage.get("prompt_tokens")
+    if completion_tokens is None:
+        completion_tokens = token_usage.get("completion_tokens")
+    if cached_tokens is None:
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+
+    return prompt_tokens or 0, cached_tokens or 0, completion_tokens or 0
+
+
+class LLMUsageTracker:
+    """Aggregates token usage per LLM call type, including provider prompt-cache hits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def record(self, call_type: str, message, latency: float):
+        prompt_tokens, cached_tokens, completion_tokens = token_counts(message)
+        with self._lock:
+            stats = self._calls.setdefault(call_type, {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "completion_tokens": 0,
+                "total_latency_seconds": 0.0,
+                "cached_calls": 0
+            })
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["total_latency_seconds"] += latency
+            stats["cached_calls"] += 1 if cached_tokens else 0
+
+        log_llm_usage(call_type, prompt_tokens, cached_tokens, completion_tokens, latency)
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for call_type, stats in self._calls.items():
+                result[call_type] = dict(
+                    stats,
+                    cache_hit_ratio=round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0,
+                    average_latency_seconds=round(stats["total_latency_seconds"] / stats["calls"], 3)
+                )
+            return result
+
+
+usage_tracker = LLMUsageTracker()
+
+
+def invoke_tracked(call_type: str, chain, inputs: dict):
+    """Invoke a prompt | llm chain and record its token usage; returns the response message"""
+    start_time = time.time()
+    message = chain.invoke(inputs)
+    usage_tracker.record(call_type, message, time.time() - start_time)
+    return message
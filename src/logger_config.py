@@ -38,7 +38,7 @@ def setup_logger():
 # Initialize logger
 chatbot_logger = setup_logger()
 
-def log_transaction(transaction_type, user_question=None, sql_query=None, data_output=None, answer=None, error=None, execution_time=None):
+def log_transaction(transaction_type, user_question=None, sql_query=None, data_output=None, answer=None, error=None, execution_time=None, db_execution_time=None):
     """
     Log chatbot transactions
     
@@ -50,6 +50,7 @@ def log_transaction(transaction_type, user_question=None, sql_query=None, data_o
         answer (str): Natural language response
         error (str): Error message if any
         execution_time (float): Time taken to execute
+        db_execution_time (float): Time spent running the SQL query against the database
     """
     # Clean SQL query by removing escape characters and normalizing whitespace
     clean_sql_query = None
@@ -71,6 +72,7 @@ def log_transaction(transaction_type, user_question=None, sql_query=None, data_o
         'answer_length': len(answer) if answer else None,
         'error': error,
         'execution_time_seconds': execution_time,
+        'db_execution_time_seconds': db_execution_time,
         'status': 'SUCCESS' if not error else 'ERROR'
     }
     
@@ -97,3 +99,25 @@ def log_user_interaction(action, details=None):
     }
     
     chatbot_logger.info(f"USER_INTERACTION: {json.dumps(log_data, ensure_ascii=False)}")
+
+def log_llm_usage(call_type, prompt_tokens, cached_tokens, completion_tokens, latency):
+    """
+    Log token usage of a single LLM call
+    
+    Args:
+        call_type (str): Which prompt was sent (e.g., 'SQL_GENERATION', 'NATURAL_LANGUAGE_RESPONSE')
+        prompt_tokens (int): Total prompt tokens
+        cached_tokens (int): Prompt tokens served from the provider's prompt cache
+        completion_tokens (int): Generated tokens
+        latency (float): Seconds until the full response was received
+    """
+    log_data = {
+        'call_type': call_type,
+        'timestamp': datetime.now().isoformat(),
+        'prompt_tokens': prompt_tokens,
+        'cached_tokens': cached_tokens,
+        'completion_tokens': completion_tokens,
+        'latency_seconds': latency
+    }
+    
+    chatbot_logger.info(f"LLM_USAGE: {json.dumps(log_data, ensure_ascii=False)}")
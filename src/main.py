@@ -1,11 +1,16 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Header, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 from datetime import datetime
 import logging
 import uuid
 from .chat import chat_with_sql
-import json
+from .figures import encode_figure, figure_id
+from .cache import get_cache
+from .jobs import JOB_DRAIN_TIMEOUT, IdempotencyConflict, JobManager, JobQueueFull
+from .admission import ADMISSION_MAX_WAIT, AdmissionRejected, admission_controller
+from .llm_usage import usage_tracker
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +23,18 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Encoded figures, keyed by content hash. Set CACHE_BACKEND=disk to share them across workers
+figure_store = get_cache("figures", max_entries=256)
+
+def store_figure(fig):
+    """Encode a figure once and return its id, or None when there is no figure"""
+    if fig is None:
+        return None
+    payload = encode_figure(fig)
+    fig_id = figure_id(payload)
+    figure_store.set(fig_id, payload)
+    return fig_id
+
 # Pydantic Models/Classes
 class ChatRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=1000, description="User question")
@@ -27,7 +44,7 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sql_query: Optional[str] = None
-    fig: Optional[object] = None
+    fig_id: Optional[str] = Field(None, description="Content-addressed figure id, fetch from /figures/{fig_id}")
     confidence_score: Optional[float] = None
     timestamp: datetime = Field(default_factory=datetime.now)
     response_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -58,6 +75,31 @@ class BatchChatRequest(BaseModel):
     user_id: Optional[str] = None
     session_id: Optional[str] = None
 
+class JobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    partial: Dict[str, Any] = Field(default_factory=dict, description="Results available so far (sql_query, answer)")
+    result: Optional[ChatResponse] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class AdmissionStats(BaseModel):
+    in_flight: int
+    max_in_flight: int
+    queue_depth: int
+    max_queue: int
+    max_queue_per_key: int
+    waiting_keys: int
+    admitted_total: int
+    rejected_total: int
+    average_wait_seconds: float
+    max_wait_seconds: float
+    average_service_seconds: float
+    estimated_wait_seconds: float
+    job_queue_depth: int
+    timestamp: datetime = Field(default_factory=datetime.now)
+
 class APIStats(BaseModel):
     total_requests: int
     successful_requests: int
@@ -66,6 +108,56 @@ class APIStats(BaseModel):
     uptime_seconds: float
 
 
+def admission_key(user_id=None, session_id=None):
+    """Fair-queuing key: requests from the same user (or session) share one queue"""
+    return user_id or session_id or "anonymous"
+
+def answer_question(question, progress=None):
+    """Run chat_with_sql and store its figure; returns (answer, sql_query, fig_id). Blocking - call off the event loop"""
+    answer, sql_query, fig = chat_with_sql(question, progress=progress)
+    return answer, sql_query, store_figure(fig)
+
+def admitted_chat(question, key, max_wait=ADMISSION_MAX_WAIT, progress=None):
+    """Answer the question once the admission controller grants a slot"""
+    with admission_controller.slot(key, max_wait=max_wait):
+        return answer_question(question, progress=progress)
+
+async def admitted_chat_async(question, key, max_wait=ADMISSION_MAX_WAIT):
+    """Wait for a slot on the event loop, then answer the question (figure encoding included) in the thread pool"""
+    # Admission happens before any thread is taken, so a saturated pool cannot delay the 429
+    async with admission_controller.slot_async(key, max_wait=max_wait):
+        return await run_in_threadpool(answer_question, question)
+
+def busy_exception(error: AdmissionRejected):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def run_chat_job(payload, progress):
+    """Job handler: answer one queued question and return the serialised ChatResponse"""
+    # Jobs are already bounded by their own queue, so they wait for a slot instead of being rejected
+    key = admission_key(payload.get("user_id"), payload.get("session_id"))
+    answer, sql_query, fig_id = admitted_chat(payload["question"], key, max_wait=None, progress=progress)
+    response = ChatResponse(
+        answer=answer,
+        sql_query=sql_query,
+        fig_id=fig_id,
+        confidence_score=0.95
+    )
+    return response.model_dump(mode="json")
+
+# Background jobs for long-running questions
+job_manager = JobManager(handler=run_chat_job)
+
+@app.on_event("shutdown")
+def drain_chat_jobs():
+    """Let queued and running jobs finish before the worker exits"""
+    if not job_manager.drain(timeout=JOB_DRAIN_TIMEOUT):
+        logger.warning("Shutting down with unfinished chat jobs")
+
+
 # Root endpoint
 @app.get("/", tags=["Root"])
 async def root():
@@ -75,7 +167,11 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "chat": "/chat",
+            "chat_jobs": "/chat/jobs",
+            "figures": "/figures/{fig_id}",
             "health": "/health",
+            "metrics": "/metrics/admission",
+            "llm_metrics": "/metrics/llm",
             "docs": "/docs"
         }
     }
@@ -89,6 +185,21 @@ async def health_check():
         database_status="connected"
     )
 
+# Admission control metrics
+@app.get("/metrics/admission", response_model=AdmissionStats, tags=["Health"])
+async def admission_metrics():
+    """Current in-flight count, queue depth and wait times of the admission controller"""
+    return AdmissionStats(**admission_controller.stats(), job_queue_depth=job_manager.queue_depth())
+
+# LLM token usage metrics
+@app.get("/metrics/llm", tags=["Health"])
+async def llm_metrics():
+    """Token usage per LLM call type, including prompt tokens served from the provider cache"""
+    return {
+        "calls": usage_tracker.stats(),
+        "timestamp": datetime.now()
+    }
+
 # Main chat endpoint
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
 async def chat_endpoint(request: ChatRequest):
@@ -96,14 +207,15 @@ async def chat_endpoint(request: ChatRequest):
     try:
         logger.info(f"Processing chat request: {request.question[:50]}...")
 
-        # Process the question
-        answer, sql_query, fig = chat_with_sql(request.question)
+        # Process the question off the event loop, once admitted
+        key = admission_key(request.user_id, request.session_id)
+        answer, sql_query, fig_id = await admitted_chat_async(request.question, key)
         
         # Create response
         response = ChatResponse(
             answer=answer,
             sql_query=sql_query,
-            fig=json.loads(fig),
+            fig_id=fig_id,
             confidence_score=0.95  # Placeholder confidence score
         )
         
@@ -120,6 +232,10 @@ async def chat_endpoint(request: ChatRequest):
         
         logger.info(f"Chat request processed successfully")
         return response
+
+    except AdmissionRejected as e:
+        logger.warning(f"Rejecting chat request: {str(e)}")
+        raise busy_exception(e)
         
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
@@ -128,6 +244,25 @@ async def chat_endpoint(request: ChatRequest):
             detail=f"Error processing request: {str(e)}"
         )
 
+# Figure endpoint
+@app.get("/figures/{fig_id}", tags=["Figures"])
+async def get_figure(fig_id: str, if_none_match: Optional[str] = Header(None)):
+    """Return a pre-encoded figure. Ids are content hashes, so responses are immutable"""
+    etag = f'"{fig_id}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=86400, immutable"}
+
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    payload = figure_store.get(fig_id)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Figure {fig_id} not found"
+        )
+
+    return Response(content=payload, media_type="application/json", headers=cache_headers)
+
 # Batch chat endpoint
 @app.post("/chat/batch", tags=["Chat"])
 async def batch_chat_endpoint(request: BatchChatRequest):
@@ -136,13 +271,15 @@ async def batch_chat_endpoint(request: BatchChatRequest):
         logger.info(f"Processing batch request with {len(request.questions)} questions")
         
         responses = []
-        for question in request.questions:
+        rejected = []
+        key = admission_key(request.user_id, request.session_id)
+        for index, question in enumerate(request.questions):
             try:
-                answer, sql_query, fig = chat_with_sql(question)
+                answer, sql_query, fig_id = await admitted_chat_async(question, key)
                 response = ChatResponse(
                     answer=answer,
                     sql_query=sql_query,
-                    fig=fig,
+                    fig_id=fig_id,
                     confidence_score=0.95
                 )
                 responses.append(response)
@@ -158,15 +295,32 @@ async def batch_chat_endpoint(request: BatchChatRequest):
                     session_id=request.session_id
                 )
                 
+            except AdmissionRejected as e:
+                # Keep the answers already paid for; the client can retry just the rejected questions
+                logger.warning(f"Rejecting question {index} of batch request: {str(e)}")
+                rejected.append({"index": index, "question": question, "detail": str(e), "retry_after": e.retry_after})
+
             except Exception as e:
                 logger.error(f"Error processing question in batch: {str(e)}")
                 continue
+
+        # Nothing was answered at all - a plain 429 is more useful than an empty result
+        if rejected and not responses:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=rejected[0]["detail"],
+                headers={"Retry-After": str(max(item["retry_after"] for item in rejected))}
+            )
         
         return {
             "responses": responses,
+            "rejected": rejected,
             "processed_count": len(responses),
             "total_questions": len(request.questions)
         }
+
+    except HTTPException:
+        raise
         
     except Exception as e:
         logger.error(f"Error processing batch request: {str(e)}")
@@ -176,7 +330,40 @@ async def batch_chat_endpoint(request: BatchChatRequest):
         )
 
 
+# Asynchronous chat job endpoints
+@app.post("/chat/jobs", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED, tags=["Chat"])
+async def create_chat_job(request: ChatRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """Queue a question and return a job id immediately. Poll GET /chat/jobs/{job_id} for the result"""
+    try:
+        key = admission_key(request.user_id, request.session_id)
+        job = job_manager.submit(request.model_dump(), key=key, idempotency_key=idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except JobQueueFull as e:
+        logger.warning(f"Rejecting chat job: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+
+    logger.info(f"Queued chat job {job['job_id']}: {request.question[:50]}...")
+    response.headers["Location"] = f"/chat/jobs/{job['job_id']}"
+    return JobStatus(**job)
 
+@app.get("/chat/jobs/{job_id}", response_model=JobStatus, tags=["Chat"])
+async def get_chat_job(job_id: str, wait: float = Query(0, ge=0, le=60, description="Seconds to long-poll for a status change")):
+    """Return the status, partial results and final ChatResponse of a job"""
+    job = await job_manager.wait(job_id, timeout=wait)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found or expired"
+        )
+    return JobStatus(**job)
 
 
 # To run: uvicorn src.main:app --reload --host 0.0.0.0 --port 8000
@@ -1,18 +1,61 @@
 from dotenv import load_dotenv
 import os
-from langchain_community.utilities import SQLDatabase
+import time
+from .incremental import incremental_cache
+from .datasources import DataSourceRegistry
+from .sqlguard import ensure_read_only, split_statements
+from .logger_config import log_transaction
 
 load_dotenv(override=True)
 
 db_uri = os.getenv("db_uri")
-db = SQLDatabase.from_uri(db_uri)
+datasources = DataSourceRegistry.from_env(db_uri)
 
 def get_schema(_):
-    schema = db.get_table_info()
+    schema = datasources.schema()
     return schema
 
 def run_query(query):
-    results = db.run(query)
+    results = datasources.default.db.run(query)
     return results
 
-#print(run_query("SELECT * FROM apmtanalytics LIMIT 1"))
\ No newline at end of file
+def _run_statement(query):
+    """Run one statement on the source that owns its tables, via its rollup or the incremental cache"""
+    source = datasources.route(query)
+
+    rollup_query, _ = source.rollups.rewrite(query)
+    if rollup_query is not None:
+        start_time = time.time()
+        result = source.execute(rollup_query)
+        log_transaction(
+            transaction_type="ROLLUP_HIT",
+            sql_query=query,
+            db_execution_time=time.time() - start_time
+        )
+        return result
+
+    return incremental_cache.run(query, source.execute)
+
+def run_queries(query):
+    """
+    Run one or more ';'-separated statements and return a list of (source name, columns, rows).
+    Statements for different data sources run in parallel. Every statement must be a read-only
+    SELECT, otherwise UnsafeQuery is raised before anything runs.
+    """
+    statements = split_statements(query)
+    for statement in statements:
+        ensure_read_only(statement)
+    results = datasources.map(_run_statement, statements)
+    return [(datasources.route(statement).name, columns, rows) for statement, (columns, rows) in zip(statements, results)]
+
+def format_rows(rows):
+    """Format rows the same way SQLDatabase.run does, for prompts and logs"""
+    return str(rows) if rows else ""
+
+def format_results(results):
+    """Format the output of run_queries for prompts and logs"""
+    if len(results) == 1:
+        return format_rows(results[0][2])
+    return "\n".join(f"[{name}] columns={columns}: {format_rows(rows)}" for name, columns, rows in results)
+
+#print(run_query("SELECT * FROM apmtanalytics LIMIT 1"))
@@ -0,0 +1,190 @@
+"""
+Offline rollup advisor.
+
+Mines the transaction logs for the most frequent and most expensive generated
+queries, materializes the hottest ones as precomputed answer sets, refreshes
+existing rollups and reports how much database time they saved.
+
+Usage:
+    python -m src.rollup_advisor analyze [--logs logs] [--top 10]
+    python -m src.rollup_advisor apply   [--logs logs] [--top 5] [--min-frequency 3]
+    python -m src.rollup_advisor refresh
+    python -m src.rollup_advisor report  [--logs logs]
+
+Each rollup is built in the data source that owns the tables its query reads,
+so the runtime finds it when the same query is routed there.
+"""
+
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from sqlalchemy import create_engine
+from .rollups import RollupCatalog, normalize_sql, query_hash, query_shape, uses_relative_time
+from .sqlguard import split_statements
+
+load_dotenv(override=True)
+
+_LOG_PREFIXES = ("TRANSACTION_SUCCESS: ", "TRANSACTION_ERROR: ")
+
+
+def read_transactions(log_dir: str):
+    """Yield the JSON payload of every transaction logged under log_dir"""
+    for path in sorted(Path(log_dir).glob("chatbot_transactions_*.log")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                for prefix in _LOG_PREFIXES:
+                    index = line.find(prefix)
+                    if index == -1:
+                        continue
+                    try:
+                        yield json.loads(line[index + len(prefix):])
+                    except json.JSONDecodeError:
+                        pass
+                    break
+
+
+def _db_seconds(transaction):
+    # Older log lines only have the end-to-end time, which over-estimates DB cost
+    seconds = transaction.get("db_execution_time_seconds")
+    if seconds is None:
+        seconds = transaction.get("execution_time_seconds")
+    return seconds or 0.0
+
+
+def mine_queries(log_dir: str):
+    """
+    Aggregate successful queries by shape (literals stripped) and by exact text.
+    Multi-source answers log several ';'-separated statements; each is counted on its own,
+    with the DB time split evenly between them.
+    Returns shapes sorted by total DB time, each with its concrete query variants.
+    """
+    shapes = defaultdict(lambda: {"count": 0, "total_seconds": 0.0, "queries": defaultdict(lambda: {"count": 0, "total_seconds": 0.0})})
+    for transaction in read_transactions(log_dir):
+        if transaction.get("transaction_type") != "SQL_CHAT_SUCCESS" or not transaction.get("sql_query"):
+            continue
+        statements = split_statements(transaction["sql_query"])
+        if not statements:
+            continue
+        seconds = _db_seconds(transaction) / len(statements)
+        for statement in statements:
+            sql = normalize_sql(statement)
+            shape = shapes[query_shape(sql)]
+            shape["count"] += 1
+            shape["total_seconds"] += seconds
+            shape["queries"][sql]["count"] += 1
+            shape["queries"][sql]["total_seconds"] += seconds
+
+    result = []
+    for shape_sql, shape in shapes.items():
+        queries = sorted(
+            ({"sql": sql, **stats, "average_seconds": stats["total_seconds"] / stats["count"]} for sql, stats in shape["queries"].items()),
+            key=lambda query: query["total_seconds"],
+            reverse=True
+        )
+        result.append({
+            "shape": shape_sql,
+            "count": shape["count"],
+            "total_seconds": shape["total_seconds"],
+            "average_seconds": shape["total_seconds"] / shape["count"],
+            "queries": queries
+        })
+    return sorted(result, key=lambda shape: shape["total_seconds"], reverse=True)
+
+
+def rollup_candidates(shapes, top: int, min_frequency: int):
+    """
+    Concrete queries worth precomputing: repeated often enough, most expensive first.
+    Queries relative to the current time are skipped, their answer changes with the clock.
+    """
+    candidates = [
+        query for shape in shapes for query in shape["queries"]
+        if query["count"] >= min_frequency and not uses_relative_time(query["sql"])
+    ]
+    return sorted(candidates, key=lambda query: query["total_seconds"], reverse=True)[:top]
+
+
+def savings_report(log_dir: str, catalogs):
+    """DB time saved by rollup hits: baseline average of the source query minus the time actually spent"""
+    entries = {}
+    for catalog in catalogs:
+        entries.update(catalog.entries(force=True))
+    per_rollup = defaultdict(lambda: {"hits": 0, "saved_seconds": 0.0})
+    for transaction in read_transactions(log_dir):
+        if transaction.get("transaction_type") != "ROLLUP_HIT" or not transaction.get("sql_query"):
+            continue
+        entry = entries.get(query_hash(transaction["sql_query"]))
+        if entry is None:
+            continue
+        stats = per_rollup[entry["table_name"]]
+        stats["hits"] += 1
+        stats["saved_seconds"] += max(0.0, entry["baseline_seconds"] - _db_seconds(transaction))
+    return dict(per_rollup)
+
+
+def rollup_catalog(source) -> RollupCatalog:
+    """Catalog on the source's primary, opened with its rollup_uri when the app account cannot create tables"""
+    if source.rollup_uri:
+        return RollupCatalog(create_engine(source.rollup_uri))
+    return source.rollups
+
+
+def _print_shapes(shapes, top):
+    print(f"{'count':>7} {'total s':>10} {'avg s':>8}  shape")
+    for shape in shapes[:top]:
+        print(f"{shape['count']:>7} {shape['total_seconds']:>10.2f} {shape['average_seconds']:>8.3f}  {shape['shape'][:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mine hot queries and manage precomputed rollups")
+    parser.add_argument("command", choices=["analyze", "apply", "refresh", "report"])
+    parser.add_argument("--logs", default="logs", help="Directory with chatbot_transactions_*.log files")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--min-frequency", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "analyze":
+        shapes = mine_queries(args.logs)
+        _print_shapes(shapes, args.top)
+        print("\nRollup candidates:")
+        for query in rollup_candidates(shapes, args.top, args.min_frequency):
+            print(f"  {query['count']:>5}x  {query['average_seconds']:.3f}s  {query['sql'][:120]}")
+        return
+
+    # Imported here so "analyze" works without database drivers installed
+    from .datasources import DataSourceRegistry
+
+    registry = DataSourceRegistry.from_env(os.getenv("db_uri"))
+    catalogs = {name: rollup_catalog(source) for name, source in registry.sources.items()}
+
+    if args.command == "apply":
+        for query in rollup_candidates(mine_queries(args.logs), args.top, args.min_frequency):
+            try:
+                source = registry.route(query["sql"])
+            except ValueError as e:
+                print(f"⚠️  Skipping query: {str(e)}")
+                continue
+            catalog = catalogs[source.name]
+            catalog.ensure_catalog()
+            entry = catalog.materialize(query["sql"], baseline_seconds=query["average_seconds"], frequency=query["count"])
+            print(f"✅ [{source.name}] {entry['table_name']}: {entry['row_count']} rows  "
+                  f"({query['count']}x, {query['average_seconds']:.3f}s avg)")
+
+    elif args.command == "refresh":
+        for name, catalog in catalogs.items():
+            catalog.ensure_catalog()
+            for entry in catalog.refresh_all():
+                print(f"🔄 [{name}] {entry['table_name']}: {entry['row_count']} rows")
+
+    elif args.command == "report":
+        report = savings_report(args.logs, catalogs.values())
+        total = sum(stats["saved_seconds"] for stats in report.values())
+        for table, stats in sorted(report.items(), key=lambda item: item[1]["saved_seconds"], reverse=True):
+            print(f"{table}: {stats['hits']} hits, {stats['saved_seconds']:.2f}s saved")
+        print(f"Total DB time saved: {total:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
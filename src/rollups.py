@@ -0,0 +1,184 @@
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from sqlalchemy import text
+
+load_dotenv(override=True)
+
+# Precomputed answer sets ("rollups") built by src/rollup_advisor.py.
+# The prefix is reserved: tables starting with it are hidden from the schema prompt and from routing,
+# so it must not be one a real table could plausibly use.
+ROLLUP_TABLE_PREFIX = "_nlc_rollup_"
+ROLLUP_CATALOG_TABLE = f"{ROLLUP_TABLE_PREFIX}catalog"
+ROLLUP_MAX_AGE = int(os.getenv("ROLLUP_MAX_AGE", "3600"))           # seconds a rollup is served after its refresh
+ROLLUP_CATALOG_RELOAD = int(os.getenv("ROLLUP_CATALOG_RELOAD", "60"))  # seconds between catalog reloads
+ROLLUP_ORDER_COLUMN = "_rollup_order"
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RELATIVE_TIME = re.compile(
+    r"\b(curdate|current_date|curtime|current_time|now|current_timestamp|localtime|localtimestamp|sysdate|"
+    r"utc_date|utc_time|utc_timestamp|unix_timestamp)\b",
+    re.IGNORECASE
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace-insensitive form of a query, used to match generated SQL against rollups"""
+    return re.sub(r"\s+", " ", sql.strip().rstrip(";")).strip()
+
+
+def query_shape(sql: str) -> str:
+    """Query with literals replaced by ?, so queries differing only in filter values group together"""
+    shape = _STRING_LITERAL.sub("?", normalize_sql(sql))
+    return _NUMBER_LITERAL.sub("?", shape).lower()
+
+
+def uses_relative_time(sql: str) -> bool:
+    """True if the result depends on when the query runs (NOW(), CURDATE(), ...), so it cannot be precomputed"""
+    return bool(_RELATIVE_TIME.search(_STRING_LITERAL.sub("''", sql)))
+
+
+def query_hash(sql: str) -> str:
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
+
+
+class RollupCatalog:
+    """
+    Registry of precomputed answer sets stored next to the analytics data.
+
+    Each rollup is a table holding the full result of one hot query plus an
+    ordering column. rewrite() swaps a matching generated query for a scan of
+    its rollup as long as the rollup is fresher than max_age.
+    """
+
+    def __init__(self, engine, max_age: int = ROLLUP_MAX_AGE, reload_interval: int = ROLLUP_CATALOG_RELOAD):
+        self.engine = engine
+        self.max_age = max_age
+        self.reload_interval = reload_interval
+        self._entries = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def ensure_catalog(self):
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {ROLLUP_CATALOG_TABLE} (
+                    query_hash VARCHAR(32) PRIMARY KEY,
+                    table_name VARCHAR(64) NOT NULL,
+                    source_sql TEXT NOT NULL,
+                    columns_json TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    baseline_seconds DOUBLE PRECISION NOT NULL,
+                    frequency INTEGER NOT NULL,
+                    refreshed_at DOUBLE PRECISION NOT NULL
+                )
+            """))
+
+    def entries(self, force: bool = False) -> dict:
+        """Catalog rows keyed by query hash, reloaded at most every reload_interval seconds"""
+        with self._lock:
+            if not force and time.time() - self._loaded_at < self.reload_interval:
+                return self._entries
+            try:
+                with self.engine.connect() as connection:
+                    rows = connection.execute(text(f"SELECT * FROM {ROLLUP_CATALOG_TABLE}")).mappings().all()
+                self._entries = {row["query_hash"]: dict(row) for row in rows}
+            except Exception:
+                # No catalog yet (advisor never ran) - behave as if there are no rollups
+                self._entries = {}
+            self._loaded_at = time.time()
+            return self._entries
+
+    def rewrite(self, sql: str):
+        """Return (rollup query, catalog entry) for a fresh matching rollup, or (None, None)"""
+        if uses_relative_time(sql):
+            return None, None
+        entry = self.entries().get(query_hash(sql))
+        if entry is None or entry["source_sql"] != normalize_sql(sql):
+            return None, None
+        if time.time() - entry["refreshed_at"] > self.max_age:
+            return None, None
+
+        quote = self.engine.dialect.identifier_preparer.quote
+        columns = ", ".join(quote(column) for column in json.loads(entry["columns_json"]))
+        return f"SELECT {columns} FROM {quote(entry['table_name'])} ORDER BY {ROLLUP_ORDER_COLUMN}", entry
+
+    def materialize(self, sql: str, baseline_seconds: float = 0.0, frequency: int = 0) -> dict:
+        """Create or refresh the rollup table for sql and record it in the catalog"""
+        if uses_relative_time(sql):
+            raise ValueError("Queries using NOW(), CURDATE() or similar change with the clock and cannot be rolled up")
+        source = normalize_sql(sql)
+        qhash = query_hash(source)
+        table = f"{ROLLUP_TABLE_PREFIX}{qhash}"
+        staging = f"{table}_new"
+
+        with self.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            result = connection.execute(text(source))
+            columns = list(result.keys())
+            rows = [tuple(row) for row in result.fetchall()]
+
+            # Build the new copy next to the old one, then swap, so readers never see a half-filled table
+            connection.execute(text(f"DROP TABLE IF EXISTS {quote(staging)}"))
+            connection.execute(text(f"CREATE TABLE {quote(staging)} AS SELECT * FROM ({source}) AS rollup_src WHERE 1 = 0"))
+            connection.execute(text(f"ALTER TABLE {quote(staging)} ADD COLUMN {ROLLUP_ORDER_COLUMN} INTEGER"))
+            if rows:
+                column_list = ", ".join(quote(column) for column in columns + [ROLLUP_ORDER_COLUMN])
+                placeholders = ", ".join(f":p{i}" for i in range(len(columns) + 1))
+                connection.execute(
+                    text(f"INSERT INTO {quote(staging)} ({column_list}) VALUES ({placeholders})"),
+                    [{f"p{i}": value for i, value in enumerate(row + (position,))} for position, row in enumerate(rows)]
+                )
+            self._swap(connection, staging, table)
+
+            entry = {
+                "query_hash": qhash,
+                "table_name": table,
+                "source_sql": source,
+                "columns_json": json.dumps(columns),
+                "row_count": len(rows),
+                "baseline_seconds": baseline_seconds,
+                "frequency": frequency,
+                "refreshed_at": time.time()
+            }
+            connection.execute(text(f"DELETE FROM {ROLLUP_CATALOG_TABLE} WHERE query_hash = :query_hash"), {"query_hash": qhash})
+            connection.execute(
+                text(f"INSERT INTO {ROLLUP_CATALOG_TABLE} ({', '.join(entry)}) VALUES ({', '.join(':' + key for key in entry)})"),
+                entry
+            )
+        return entry
+
+    def _swap(self, connection, staging: str, table: str):
+        quote = connection.dialect.identifier_preparer.quote
+        if connection.dialect.name == "mysql":
+            exists = connection.execute(text(f"SHOW TABLES LIKE '{table}'")).first() is not None
+            if exists:
+                old = f"{table}_old"
+                connection.execute(text(f"DROP TABLE IF EXISTS {quote(old)}"))
+                connection.execute(text(f"RENAME TABLE {quote(table)} TO {quote(old)}, {quote(staging)} TO {quote(table)}"))
+                connection.execute(text(f"DROP TABLE {quote(old)}"))
+                return
+        connection.execute(text(f"DROP TABLE IF EXISTS {quote(table)}"))
+        connection.execute(text(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table)}"))
+
+    def refresh_all(self):
+        """Re-run every catalogued source query into its rollup"""
+        return [
+            self.materialize(entry["source_sql"], entry["baseline_seconds"], entry["frequency"])
+            for entry in self.entries(force=True).values()
+        ]
+
+    def drop(self, qhash: str):
+        entry = self.entries(force=True).get(qhash)
+        if entry is None:
+            return
+        with self.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            connection.execute(text(f"DROP TABLE IF EXISTS {quote(entry['table_name'])}"))
+            connection.execute(text(f"DELETE FROM {ROLLUP_CATALOG_TABLE} WHERE query_hash = :query_hash"), {"query_hash": qhash})
+        self.entries(force=True)
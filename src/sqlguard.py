@@ -0,0 +1,200 @@
+import re
+
+_WORD = re.compile(r"[\w$]+")
+# Words that end the FROM clause of the enclosing query
+_FROM_CLAUSE_END = {
+    "where", "group", "having", "order", "limit", "union", "except", "intersect", "window",
+    "for", "lock", "into", "select", "with",
+}
+_NOT_A_TABLE = {"dual", "lateral"}
+
+
+class UnsafeQuery(ValueError):
+    """Raised for a generated statement that is not a single read-only SELECT"""
+
+
+def _comment_dashes(sql: str, index: int) -> bool:
+    # MySQL only starts a "--" comment when the dashes are followed by whitespace, a control character or the end
+    return sql.startswith("--", index) and sql[index + 2:index + 3] <= " "
+
+
+def _tokens(sql: str):
+    """
+    Scan sql left to right and yield (kind, value, position) tuples. kind is "word" (lower-cased),
+    "name" (backtick-quoted identifier), "string", "executable" (a /*! ... */ comment) or "punct"
+    (one character). Whitespace and ordinary comments are skipped, so quotes inside comments and
+    semicolons or keywords inside literals cannot change how the rest of the text is read.
+    """
+    index, length = 0, len(sql)
+    while index < length:
+        char = sql[index]
+        if char.isspace():
+            index += 1
+        elif char == "#" or _comment_dashes(sql, index):
+            end = sql.find("\n", index)
+            index = length if end < 0 else end + 1
+        elif sql.startswith("/*", index):
+            end = sql.find("*/", index + 2)
+            end = length if end < 0 else end + 2
+            if sql.startswith("/*!", index):
+                # MySQL executes the contents of /*! ... */ comments
+                yield "executable", sql[index:end], index
+            index = end
+        elif char in "'\"`":
+            start, value = index, []
+            index += 1
+            while index < length:
+                if sql[index] == "\\" and char != "`":
+                    value.append(sql[index + 1:index + 2])
+                    index += 2
+                elif sql[index] != char:
+                    value.append(sql[index])
+                    index += 1
+                elif sql[index + 1:index + 2] == char:
+                    # A doubled quote stands for the quote character itself
+                    value.append(char)
+                    index += 2
+                else:
+                    index += 1
+                    break
+            yield ("name" if char == "`" else "string"), "".join(value), start
+        else:
+            match = _WORD.match(sql, index)
+            if match:
+                yield "word", match.group().lower(), index
+                index = match.end()
+            else:
+                yield "punct", char, index
+                index += 1
+
+
+def _punct(tokens, index, char) -> bool:
+    return index < len(tokens) and tokens[index][0] == "punct" and tokens[index][1] == char
+
+
+def _word(tokens, index):
+    return tokens[index][1] if index < len(tokens) and tokens[index][0] == "word" else None
+
+
+def _skip_parentheses(tokens, index) -> int:
+    """Index just past the parenthesised group that opens at index"""
+    depth = 0
+    while index < len(tokens):
+        if _punct(tokens, index, "("):
+            depth += 1
+        elif _punct(tokens, index, ")"):
+            depth -= 1
+        index += 1
+        if depth == 0:
+            break
+    return index
+
+
+def split_statements(sql: str):
+    """Split on semicolons outside literals and comments, dropping empty and comment-only statements"""
+    statements, start, has_tokens = [], 0, False
+    for kind, value, position in _tokens(sql):
+        if kind == "punct" and value == ";":
+            if has_tokens:
+                statements.append(sql[start:position].strip())
+            start, has_tokens = position + 1, False
+        else:
+            has_tokens = True
+    if has_tokens:
+        statements.append(sql[start:].strip())
+    return statements
+
+
+def referenced_tables(sql: str):
+    """
+    Lower-cased table names listed in FROM clauses (including comma-separated lists) and after JOIN,
+    without schema qualifiers. Subqueries are included; FROM inside function calls such as
+    EXTRACT(YEAR FROM col) or TRIM(... FROM col) is not a table reference.
+    """
+    tokens = list(_tokens(sql))
+    tables = set()
+    # One frame per open parenthesis: whether it holds a query, is inside its FROM clause, expects a table next
+    frames = [{"query": True, "from": False, "expect": False}]
+    index = 0
+    while index < len(tokens):
+        kind, value, _ = tokens[index]
+        frame = frames[-1]
+        if kind == "punct" and value == "(":
+            # A parenthesis where a table is expected holds a derived table or a nested join
+            in_table_position = frame["query"] and frame["expect"]
+            frame["expect"] = False
+            frames.append({
+                "query": in_table_position or _word(tokens, index + 1) in ("select", "with"),
+                "from": in_table_position,
+                "expect": in_table_position,
+            })
+        elif kind == "punct" and value == ")":
+            if len(frames) > 1:
+                frames.pop()
+        elif not frame["query"]:
+            pass
+        elif frame["expect"] and kind in ("word", "name") and value not in _NOT_A_TABLE | {"select", "with"}:
+            # Keep only the last part of db.table
+            while index + 2 < len(tokens) and _punct(tokens, index + 1, ".") and tokens[index + 2][0] in ("word", "name"):
+                index += 2
+                value = tokens[index][1]
+            tables.add(value.lower())
+            frame["expect"] = False
+        elif kind == "word" and value == "from":
+            frame["from"] = frame["expect"] = True
+        elif kind == "word" and value in ("join", "straight_join"):
+            frame["from"] = frame["expect"] = True
+        elif kind == "word" and value in _FROM_CLAUSE_END:
+            frame["from"] = frame["expect"] = False
+        elif kind == "punct" and value == "," and frame["from"]:
+            frame["expect"] = True
+        index += 1
+    return tables
+
+
+def _statement_verb(tokens):
+    """The word that decides what a statement does: its first word, or the one after its WITH clause"""
+    index = 0
+    while _punct(tokens, index, "("):
+        index += 1
+    if _word(tokens, index) != "with":
+        return _word(tokens, index)
+    index += 1
+    if _word(tokens, index) == "recursive":
+        index += 1
+    # name [(columns)] AS (query) [, ...]
+    while True:
+        index += 1
+        if _punct(tokens, index, "("):
+            index = _skip_parentheses(tokens, index)
+        if _word(tokens, index) != "as" or not _punct(tokens, index + 1, "("):
+            return None
+        index = _skip_parentheses(tokens, index + 1)
+        if not _punct(tokens, index, ","):
+            break
+        index += 1
+    while _punct(tokens, index, "("):
+        index += 1
+    return _word(tokens, index)
+
+
+def ensure_read_only(statement: str):
+    """
+    Raise UnsafeQuery unless statement (one entry of split_statements) is a plain SELECT.
+    Keywords are only checked where they act as keywords, so columns named like them
+    (handler, load, ...) and text inside literals or comments are not mistaken for writes.
+    """
+    tokens = list(_tokens(statement))
+    for kind, value, _ in tokens:
+        if kind == "executable":
+            raise UnsafeQuery("Executable comments are not allowed")
+        if kind == "punct" and value == ";":
+            raise UnsafeQuery("Only one statement may be run at a time")
+    if _statement_verb(tokens) != "select":
+        raise UnsafeQuery("Only SELECT queries are allowed")
+    # INTO is a reserved word, so outside backticks it can only be SELECT ... INTO OUTFILE/DUMPFILE/@var
+    words = [value for kind, value, _ in tokens if kind == "word"]
+    if "into" in words:
+        raise UnsafeQuery("INTO is not allowed in a read-only query")
+    if any(word == "for" and following == "update" for word, following in zip(words, words[1:])):
+        raise UnsafeQuery("FOR UPDATE is not allowed in a read-only query")
@@ -1,8 +1,11 @@
 import streamlit as st
-import plotly.io as pio
 import requests
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from pathlib import Path
-import json
+from figures import decode_figure
 
 logo_path = Path(__file__).parent.parent / "docs" / "maersk.jpeg"
 
@@ -15,6 +18,11 @@ st.set_page_config(
 # Initialize session state for chat history
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "pending" not in st.session_state:
+    st.session_state.pending = None
+# Sent with every question so the API queues each browser session fairly
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
 
 # Logo in upper left corner
 logo_container = st.container()
@@ -28,83 +36,151 @@ with logo_container:
 
 # API Configuration
 API_BASE_URL = "http://localhost:8000"
-CHAT_ENDPOINT = f"{API_BASE_URL}/chat"
+JOBS_ENDPOINT = f"{API_BASE_URL}/chat/jobs"
+FIGURE_ENDPOINT = f"{API_BASE_URL}/figures"
+REQUEST_TIMEOUT = (5, 60)  # (connect, read) seconds - long-running questions are polled as jobs
+JOB_LONG_POLL = 25
+JOB_CLIENT_TIMEOUT = 600  # seconds before giving up on a job, so a stuck job cannot hold an executor thread
 
-def send_chat_request(question):
-    """Send chat request to the API"""
+# Session history limits - older messages are dropped, older charts are only rendered on demand
+MAX_HISTORY_MESSAGES = 100
+INLINE_FIGURES = 5
+POLL_INTERVAL = 1
+
+@st.cache_resource
+def get_http_session():
+    """Pooled HTTP session shared by all reruns and browser sessions"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=1)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_executor():
+    """Background workers so a long-running question never blocks the script thread"""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat-request")
+
+def send_chat_request(session, question, session_id):
+    """Submit the question as a job and long-poll until it finishes or JOB_CLIENT_TIMEOUT expires"""
     try:
-        payload = {"question": question}
-        response = requests.post(CHAT_ENDPOINT, json=payload, timeout=300)
-        
-        if response.status_code == 200:
-            return response.json(), None
-        else:
+        payload = {"question": question, "session_id": session_id}
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        response = session.post(JOBS_ENDPOINT, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 202:
             return None, f"API Error: {response.status_code}"
+
+        job_url = f"{JOBS_ENDPOINT}/{response.json()['job_id']}"
+        deadline = time.monotonic() + JOB_CLIENT_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, f"No answer after {JOB_CLIENT_TIMEOUT} seconds, please try again later"
+            wait = max(1, min(JOB_LONG_POLL, int(remaining)))
+            response = session.get(job_url, params={"wait": wait}, timeout=REQUEST_TIMEOUT)
+            if response.status_code != 200:
+                return None, f"API Error: {response.status_code}"
+
+            job = response.json()
+            if job["status"] == "succeeded":
+                return job["result"], None
+            if job["status"] == "failed":
+                return None, job.get("error") or "Job failed"
             
     except Exception as e:
         return None, f"Error: {str(e)}"
 
+@st.cache_resource(max_entries=64, show_spinner=False)
+def load_figure(fig_id):
+    """Fetch and decode a figure once per id - ids are content hashes so they never go stale"""
+    response = get_http_session().get(f"{FIGURE_ENDPOINT}/{fig_id}", timeout=30)
+    response.raise_for_status()
+    return decode_figure(response.content)
+
+def show_figure(fig_id):
+    """Render a cached figure inside the current chat message"""
+    try:
+        st.plotly_chart(load_figure(fig_id), use_container_width=True)
+    except Exception:
+        st.info("Chart data received but couldn't be displayed")
+
+def append_message(message):
+    """Add a message to the history, keeping at most MAX_HISTORY_MESSAGES in memory"""
+    st.session_state.messages.append(message)
+    del st.session_state.messages[:-MAX_HISTORY_MESSAGES]
+
+def collect_response(future):
+    """Turn a finished request into an assistant message"""
+    response_data, error = future.result()
+    if error:
+        return {"role": "assistant", "content": f"Error: {error}", "error": True}
+
+    message_data = {"role": "assistant", "content": response_data.get("answer", "No response")}
+    # Only the figure id is kept in session state, the decoded figure lives in load_figure's cache
+    if response_data.get("fig_id"):
+        message_data["fig_id"] = response_data["fig_id"]
+    return message_data
+
+@st.fragment(run_every=POLL_INTERVAL)
+def pending_response():
+    """
+    Poll the in-flight request. Only this fragment reruns while waiting, so the
+    history is not replayed; the full app reruns once when the answer arrives.
+    """
+    pending = st.session_state.pending
+    if pending is None:
+        return
+    if pending.done():
+        append_message(collect_response(pending))
+        st.session_state.pending = None
+        st.rerun(scope="app")
+    with st.chat_message("assistant"):
+        st.write("Processing...")
+
 # Header
 st.title("AMS-SAP Analytics Chatbot")
 
+# Chat input at the bottom - disabled while a question is in flight
+if prompt := st.chat_input("Ask your question about APMT analytics...", disabled=st.session_state.pending is not None):
+    append_message({"role": "user", "content": prompt})
+    st.session_state.pending = get_executor().submit(send_chat_request, get_http_session(), prompt, st.session_state.session_id)
+
+# Move a finished request into the history before rendering
+pending = st.session_state.pending
+if pending is not None and pending.done():
+    append_message(collect_response(pending))
+    st.session_state.pending = None
+    pending = None
+
 # Display chat history
+assistant_indexes = [i for i, message in enumerate(st.session_state.messages) if message["role"] == "assistant"]
+inline_from = assistant_indexes[-INLINE_FIGURES] if len(assistant_indexes) >= INLINE_FIGURES else 0
+
 chat_container = st.container()
 with chat_container:
-    for message in st.session_state.messages:
+    for index, message in enumerate(st.session_state.messages):
         if message["role"] == "user":
             with st.chat_message("user"):
                 st.write(message["content"])
         else:
             with st.chat_message("assistant"):
-                st.write(message["content"])
-                if "fig" in message and message["fig"]:
-                    try:
-                        fig_from_json = pio.from_json(message["fig"])
-                        st.plotly_chart(fig_from_json, use_container_width=True)
-                    except:
-                        st.info("Chart data received but couldn't be displayed")
-
-# Chat input at the bottom
-if prompt := st.chat_input("Ask your question about APMT analytics..."):
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    
-    # Display user message
-    with st.chat_message("user"):
-        st.write(prompt)
-    
-    # Get bot response
-    with st.chat_message("assistant"):
-        with st.spinner("Processing..."):
-            response_data, error = send_chat_request(prompt)
-        
-        if error:
-            error_message = f"Error: {error}"
-            st.error(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": error_message})
-        else:
-            answer = response_data.get("answer", "No response")
-            st.write(answer)
-            
-            # Store response in session state
-            message_data = {"role": "assistant", "content": answer}
-            
-            # Handle chart if present
-            if response_data.get("fig"):
-                message_data["fig"] = json.dumps(response_data["fig"])
-                try:
-                    fig_from_json = pio.from_json(message_data["fig"])
-                    st.plotly_chart(fig_from_json, use_container_width=True)
-                except:
-                    st.info("Chart data received but couldn't be displayed")
-            
-            st.session_state.messages.append(message_data)
+                if message.get("error"):
+                    st.error(message["content"])
+                else:
+                    st.write(message["content"])
+                if message.get("fig_id"):
+                    if index >= inline_from or st.toggle("Show chart", key=f"show_fig_{index}_{message['fig_id']}"):
+                        show_figure(message["fig_id"])
+
+    if pending is not None:
+        pending_response()
 
 # Add a clear chat button in the sidebar
 with st.sidebar:
     st.subheader("Chat Controls")
     if st.button("Clear Chat History"):
         st.session_state.messages = []
+        st.session_state.pending = None
         st.rerun()
     
     st.write(f"**Messages in conversation:** {len(st.session_state.messages)}")
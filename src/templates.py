@@ -1,14 +1,22 @@
 # Templates for LangChain prompts
+#
+# Each prompt is split into a static system message and a per-request user message.
+# Azure OpenAI caches prompt prefixes, so everything that does not change between
+# requests (instructions, schema) comes first and the question/data come last.
+# The SQL and answer prompts both open with the same schema block, so they can
+# also reuse each other's cached prefix.
 
-# Template for converting natural language to Dremio SQL
-SQL_GENERATION_TEMPLATE = """
+# Shared opening of every prompt that needs the database schema
+SCHEMA_PREFIX = """Database schema:
+{schema}
+"""
+
+# Template for converting natural language to MySQL
+SQL_GENERATION_SYSTEM_TEMPLATE = SCHEMA_PREFIX + """
 You are an expert SQL query generator for MySQL.
-You will be provided with a database schema and a user question.
+You will be provided with the database schema above and a user question.
 Your task is to generate a valid MySQL query that answers the user's question using only the tables and columns provided in the schema.
 
-Schema:
-{schema}
-
 Instructions:
 Use only the tables and columns defined in the schema.
 Output only the SQL query, without any explanation or comments.
@@ -17,24 +25,26 @@ For string filtering, ALWAYS use LOWER(column) LIKE LOWER('%<value>%')
 If multiple interpretations are possible, choose the most logical and commonly expected one.
 Ensure the query is syntactically correct and optimized for readability.
 performance related metrics are defined from resolution count.
+The schema may be split into sections marked "-- Data source: <name>". Never join tables from different data sources;
+if the question needs several data sources, write one query per data source and separate the queries with a semicolon.
+"""
 
-Question:
+SQL_GENERATION_USER_TEMPLATE = """Question:
 {question}
 """
 
 # Template for converting SQL results to natural language response
-NATURAL_LANGUAGE_RESPONSE_TEMPLATE = """Based on the table schema below, question, sql query, and sql response, write a natural language response.
-{schema}
-Question: {question}
+NATURAL_LANGUAGE_RESPONSE_SYSTEM_TEMPLATE = SCHEMA_PREFIX + """
+Based on the table schema above and the question, sql query, and sql response provided by the user, write a natural language response.
+"""
+
+NATURAL_LANGUAGE_RESPONSE_USER_TEMPLATE = """Question: {question}
 SQL Query: {query}
 SQL Response: {response}"""
 
 # Template for generating Plotly code from SQL response data
-GRAPH_GENERATION_TEMPLATE = """
-Generate interactive Plotly code for the given data. Consider the user's original question to create the most appropriate visualization.
-
-User Question: {user_question}
-Data: {query}
+GRAPH_GENERATION_SYSTEM_TEMPLATE = """
+Generate interactive Plotly code for the data given by the user. Consider the user's original question to create the most appropriate visualization.
 
 Create flashy, modern, professional, presentation-ready, stylish, bold, clean, with data labels Plotly code that:
 Bold title with emojis
@@ -57,9 +67,9 @@ Makes it interactive with hover tooltips
 - Only return executable Python Plotly code, no explanations
 - Import plotly.express as px and/or plotly.graph_objects as go at the start
 - DO NOT use px.data.frame or any px.data.* - these are sample datasets, not functions
-- Parse the actual data provided in the query parameter
+- Parse the actual data provided by the user
 - Use pandas.DataFrame() to convert the data if needed
-- Start directly with the python code. DO NOT start with: ```python 
+- Start directly with the python code. DO NOT start with: ```python
 - End with: fig (to return the figure object)
 - Use the actual data structure provided, not sample data
 - Boxplots should be horizontal (orientation='h')
@@ -68,11 +78,17 @@ Example data parsing:
 import pandas as pd
 import plotly.express as px
 
-# Parse the data from query parameter
-data = {query}
+# Parse the data provided by the user
+data = <the data exactly as provided>
 if 'rows' in data:
     df = pd.DataFrame(data['rows'])
     # Your visualization code here
 fig = px.bar(df, x='column1', y='column2', title='Your Title')
 fig
-"""
\ No newline at end of file
+"""
+
+GRAPH_GENERATION_USER_TEMPLATE = """User Question: {user_question}
+Data: {query}"""
+
+# Appended as a follow-up user message when generated graph code fails, keeping the cached prefix intact
+GRAPH_GENERATION_RETRY_TEMPLATE = """Previous attempt failed with error: {error}. Please fix the code."""
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from src.admission import AdmissionController, AdmissionRejected
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def queue_waiters(controller, key, count):
+    """Start count threads that wait for a slot under key; returns them once they are all queued"""
+    threads = [threading.Thread(target=controller.acquire, args=(key,), kwargs={"max_wait": 5}) for _ in range(count)]
+    before = controller.stats()["queue_depth"]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: controller.stats()["queue_depth"] == before + count)
+    return threads
+
+
+def test_one_key_cannot_fill_the_whole_queue():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, max_queue_per_key=2)
+    controller.acquire("busy", max_wait=5)
+    waiters = queue_waiters(controller, "busy", 2)
+
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("busy", max_wait=5)
+    # Another user still gets a place in the queue
+    waiters += queue_waiters(controller, "other", 1)
+
+    for _ in range(4):
+        controller.release()
+    for thread in waiters:
+        thread.join(timeout=5)
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_full_queue_rejects_everyone():
+    controller = AdmissionController(max_in_flight=1, max_queue=2, max_queue_per_key=2)
+    controller.acquire("a", max_wait=5)
+    waiters = queue_waiters(controller, "a", 1) + queue_waiters(controller, "b", 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("c", max_wait=5)
+    assert rejected.value.retry_after >= 1
+
+    for _ in range(3):
+        controller.release()
+    for thread in waiters:
+        thread.join(timeout=5)
+
+
+def test_slots_are_handed_out_round_robin():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, max_queue_per_key=10)
+    controller.acquire("first", max_wait=5)
+    order = []
+
+    def wait(key):
+        controller.acquire(key, max_wait=5)
+        order.append(key)
+
+    threads = []
+    for key in ("a", "a", "a", "b"):
+        thread = threading.Thread(target=wait, args=(key,))
+        depth = controller.stats()["queue_depth"]
+        thread.start()
+        wait_until(lambda: controller.stats()["queue_depth"] > depth)
+        threads.append(thread)
+
+    # Hand the single slot on one waiter at a time
+    for served in range(1, 5):
+        controller.release()
+        wait_until(lambda: len(order) == served)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["a", "b", "a", "a"]
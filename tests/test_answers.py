@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from src.answers import format_value, humanize_column, synthesize_answer
+
+
+def test_how_many_question_is_answered_in_its_own_words():
+    answer = synthesize_answer("How many new users were there yesterday?", ["new_users"], [(4074,)])
+    assert answer == "There were **4,074** new users."
+
+
+def test_how_many_present_tense_and_single_count():
+    assert synthesize_answer("How many open tickets are there?", ["COUNT(*)"], [(12,)]) == "There are **12** open tickets."
+    assert synthesize_answer("How many open tickets are there?", ["COUNT(*)"], [(1,)]) == "Count: **1**."
+
+
+def test_scalar_without_matching_question_uses_a_label():
+    answer = synthesize_answer("New users yesterday", ["new_users"], [(4074,)])
+    assert answer == "New users: **4,074**."
+
+
+def test_count_distinct_id_column():
+    assert humanize_column("COUNT(DISTINCT user_id)") == "number of distinct users"
+    answer = synthesize_answer("Active users this month", ["COUNT(DISTINCT user_id)"], [(4074,)])
+    assert answer == "Number of distinct users: **4,074**."
+
+
+def test_units_come_from_the_column_name():
+    answer = synthesize_answer("Average resolution time", ["avg_resolution_time_hours"], [(Decimal("3.456"),)])
+    assert answer == "Average resolution time: **3.46 hours**."
+
+
+def test_percent_fraction_is_left_to_the_llm():
+    assert synthesize_answer("What share of tickets were resolved?", ["resolved_pct"], [(0.4231,)]) is None
+    assert synthesize_answer("Resolution summary", ["resolved", "resolved_pct"], [(12, 0.42)]) is None
+
+
+def test_percent_above_one_is_formatted():
+    assert format_value("resolved_pct", 42.31) == "42.31%"
+    assert synthesize_answer("Resolved share", ["resolved_pct"], [(42.31,)]) == "Resolved percentage: **42.31%**."
+
+
+def test_single_row_is_listed():
+    answer = synthesize_answer("Ticket totals", ["open_tickets", "closed_tickets"], [(3, 5)])
+    assert answer == "Here is the result:\n- **Open tickets**: 3\n- **Closed tickets**: 5"
+
+
+def test_empty_and_unsupported_results():
+    assert synthesize_answer("How many users?", ["n"], []) == "No matching data was found for your question."
+    assert synthesize_answer("How many users?", ["n"], [(None,)]) == "No matching data was found for your question."
+    assert synthesize_answer("Users per day", ["day", "n"], [("2024-01-01", 1), ("2024-01-02", 2)]) is None
+    assert synthesize_answer("Why did new users drop?", ["new_users"], [(4074,)]) is None
@@ -0,0 +1,131 @@
+import json
+import sqlite3
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from src.incremental import IncrementalResultCache, TimeBucketQuery, _dump_entry, _load_entry
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def database():
+    """SQLite database with one event per user per day for the last 10 days, and a settable CURDATE()"""
+    clock = {"today": TODAY}
+    connection = sqlite3.connect(":memory:")
+    connection.create_function("curdate", 0, lambda: clock["today"].isoformat())
+    connection.execute("CREATE TABLE events (user_id INTEGER, amount INTEGER, created_at TEXT)")
+    for days_ago in range(10):
+        day = TODAY - timedelta(days=days_ago)
+        for user_id in range(3):
+            connection.execute("INSERT INTO events VALUES (?, ?, ?)", (user_id, days_ago + user_id, f"{day.isoformat()} 10:00:00"))
+
+    calls = []
+
+    def execute(sql):
+        calls.append(sql)
+        cursor = connection.execute(sql)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+    yield connection, execute, calls, clock
+    connection.close()
+
+
+DAILY = "SELECT DATE(created_at) AS day, COUNT(*) AS events, SUM(amount) AS amount FROM events GROUP BY DATE(created_at) ORDER BY day"
+
+
+@pytest.mark.parametrize("sql", [
+    DAILY,
+    "SELECT DATE(created_at), COUNT(*) FROM events GROUP BY 1",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE user_id = 1 GROUP BY day ORDER BY day DESC",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE created_at >= date(CURDATE(), '-7 day') GROUP BY day",
+    "SELECT DATE(e.created_at) AS day, COUNT(*) FROM events e JOIN users u ON u.id = e.user_id "
+    "WHERE DATE(e.created_at) >= CURDATE() - INTERVAL 7 DAY AND u.country = 'DK' GROUP BY day",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE created_at >= CURRENT_DATE - INTERVAL 14 DAY GROUP BY day",
+])
+def test_parse_accepts_time_bucketed_aggregates(sql):
+    assert TimeBucketQuery.parse(sql) is not None
+
+
+def test_parse_marks_relative_windows_as_sliding():
+    assert not TimeBucketQuery.parse(DAILY).sliding
+    sliding = TimeBucketQuery.parse("SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE created_at >= CURDATE() - INTERVAL 7 DAY GROUP BY day")
+    assert sliding.sliding and sliding.column == "created_at"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT user_id, COUNT(*) FROM events GROUP BY user_id",
+    DAILY + " LIMIT 5",
+    "SELECT DATE(created_at) AS day, COUNT(*) AS n FROM events GROUP BY day ORDER BY n DESC",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events GROUP BY day UNION SELECT DATE(created_at), 1 FROM events GROUP BY 1",
+    # Relative time outside a range on the bucket column can change days that are already cached
+    "SELECT DATE(e.created_at) AS day, COUNT(*) FROM events e JOIN sessions t ON t.user_id = e.user_id "
+    "AND t.ts >= NOW() - INTERVAL 7 DAY GROUP BY 1",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events GROUP BY day HAVING MAX(created_at) >= NOW() - INTERVAL 1 DAY",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM users WHERE last_login >= NOW() - INTERVAL 1 DAY GROUP BY day",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE created_at >= CURDATE() OR user_id = 1 GROUP BY day",
+    "SELECT DATE(created_at) AS day, DATEDIFF(CURDATE(), MIN(created_at)) FROM events GROUP BY day",
+    # A NOW()-based or sub-day bound only covers part of the window's first day
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE created_at >= NOW() - INTERVAL 14 DAY GROUP BY day",
+    "SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE created_at >= CURDATE() - INTERVAL 36 HOUR GROUP BY day",
+])
+def test_parse_rejects_unsupported_queries(sql):
+    assert TimeBucketQuery.parse(sql) is None
+
+
+def test_relative_time_inside_string_literal_is_ignored():
+    query = TimeBucketQuery.parse("SELECT DATE(created_at) AS day, COUNT(*) FROM events WHERE note = 'now' GROUP BY day")
+    assert query is not None and not query.sliding
+
+
+def test_delta_merge_matches_full_recompute(database):
+    connection, execute, calls, _ = database
+    cache = IncrementalResultCache(seal_lag_days=1, tables={"events"})
+
+    assert cache.run(DAILY, execute) == execute(DAILY)
+
+    # New rows land in the still-open days only
+    connection.execute("INSERT INTO events VALUES (7, 100, ?)", (f"{TODAY.isoformat()} 12:00:00",))
+    connection.execute("INSERT INTO events VALUES (7, 50, ?)", (f"{(TODAY - timedelta(days=1)).isoformat()} 12:00:00",))
+
+    calls.clear()
+    merged = cache.run(DAILY, execute)
+    assert calls == [TimeBucketQuery.parse(DAILY).delta_query(TODAY - timedelta(days=1))]
+    assert merged == execute(DAILY)
+
+
+def test_sliding_window_drops_days_that_left_the_window(database):
+    _, execute, _, clock = database
+    sql = "SELECT DATE(created_at) AS day, COUNT(*) AS events FROM events WHERE created_at >= date(CURDATE(), '-3 day') GROUP BY day ORDER BY day"
+    cache = IncrementalResultCache(seal_lag_days=1, tables={"events"})
+
+    assert cache.run(sql, execute) == execute(sql)
+
+    clock["today"] = TODAY + timedelta(days=1)
+    columns, rows = cache.run(sql, execute)
+    assert (columns, rows) == execute(sql)
+    assert rows[0][0] == (TODAY - timedelta(days=2)).isoformat()
+
+
+def test_only_listed_tables_are_cached(database):
+    _, execute, calls, _ = database
+    cache = IncrementalResultCache(seal_lag_days=1, tables=set())
+
+    cache.run(DAILY, execute)
+    calls.clear()
+    cache.run(DAILY, execute)
+    assert calls == [DAILY]
+
+
+def test_entries_round_trip_as_json():
+    buckets = {
+        date(2024, 1, 2): [(datetime(2024, 1, 2, 8, 30), Decimal("1.50"), timedelta(minutes=5), "x", None)],
+    }
+    payload = _dump_entry(["ts", "amount", "duration", "label", "missing"], buckets, date(2024, 1, 3))
+
+    assert json.loads(payload)["sealed_before"] == "2024-01-03"
+    entry = _load_entry(payload)
+    assert entry["buckets"] == buckets
+    assert entry["sealed_before"] == date(2024, 1, 3)
@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.rollup_advisor import mine_queries, rollup_candidates, savings_report
+from src.rollups import ROLLUP_CATALOG_TABLE, ROLLUP_TABLE_PREFIX, RollupCatalog, query_hash, uses_relative_time
+
+HOT_QUERY = "SELECT region, COUNT(*) AS tickets FROM tickets GROUP BY region ORDER BY tickets DESC, region"
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE tickets (id INTEGER PRIMARY KEY, region TEXT)"))
+        # A real table whose name merely starts with "rollup_" must not be mistaken for a rollup
+        connection.execute(text("CREATE TABLE rollup_history (id INTEGER)"))
+        connection.execute(text("INSERT INTO tickets (region) VALUES ('eu'), ('eu'), ('us'), ('apac'), ('eu'), ('us')"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def catalog(engine):
+    catalog = RollupCatalog(engine, reload_interval=0)
+    catalog.ensure_catalog()
+    return catalog
+
+
+def run(engine, sql):
+    with engine.connect() as connection:
+        result = connection.execute(text(sql))
+        return list(result.keys()), [tuple(row) for row in result.fetchall()]
+
+
+def test_rollup_tables_use_the_reserved_prefix():
+    assert ROLLUP_CATALOG_TABLE.startswith(ROLLUP_TABLE_PREFIX)
+    assert not "rollup_history".startswith(ROLLUP_TABLE_PREFIX)
+
+
+def test_materialize_rewrite_refresh(engine, catalog):
+    assert catalog.rewrite(HOT_QUERY) == (None, None)
+
+    entry = catalog.materialize(HOT_QUERY, baseline_seconds=2.5, frequency=7)
+    assert entry["table_name"] == f"{ROLLUP_TABLE_PREFIX}{query_hash(HOT_QUERY)}"
+    assert entry["row_count"] == 3
+
+    # Whitespace differences still match, and the rollup returns the same columns and order
+    rollup_query, hit = catalog.rewrite(HOT_QUERY.replace(" ", "  ") + ";")
+    assert hit["query_hash"] == entry["query_hash"]
+    assert run(engine, rollup_query) == run(engine, HOT_QUERY)
+
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO tickets (region) VALUES ('us'), ('us')"))
+    assert run(engine, rollup_query) != run(engine, HOT_QUERY)
+
+    refreshed = catalog.refresh_all()
+    assert [item["table_name"] for item in refreshed] == [entry["table_name"]]
+    assert refreshed[0]["baseline_seconds"] == 2.5
+    assert run(engine, rollup_query) == run(engine, HOT_QUERY)
+
+
+def test_stale_or_different_queries_are_not_rewritten(engine, catalog):
+    catalog.materialize(HOT_QUERY)
+    assert catalog.rewrite(HOT_QUERY.replace("DESC", "ASC")) == (None, None)
+
+    catalog.max_age = -1
+    assert catalog.rewrite(HOT_QUERY) == (None, None)
+
+
+def test_drop_removes_table_and_entry(engine, catalog):
+    entry = catalog.materialize(HOT_QUERY)
+    catalog.drop(entry["query_hash"])
+    assert catalog.entries(force=True) == {}
+    with engine.connect() as connection:
+        assert connection.execute(text(f"SELECT name FROM sqlite_master WHERE name = '{entry['table_name']}'")).first() is None
+
+
+def write_log(log_dir, transactions):
+    lines = [f"2024-01-01 10:00:00,000 - INFO - TRANSACTION_SUCCESS: {json.dumps(transaction)}\n" for transaction in transactions]
+    (log_dir / "chatbot_transactions_20240101.log").write_text("".join(lines), encoding="utf-8")
+
+
+def test_mining_and_savings_report(tmp_path, catalog):
+    cold = "SELECT COUNT(*) FROM tickets WHERE region = 'eu'"
+    write_log(tmp_path, [
+        *[{"transaction_type": "SQL_CHAT_SUCCESS", "sql_query": HOT_QUERY, "db_execution_time_seconds": 2.0}] * 3,
+        {"transaction_type": "SQL_CHAT_SUCCESS", "sql_query": cold, "db_execution_time_seconds": 0.1},
+        {"transaction_type": "SQL_CHAT_ERROR", "sql_query": HOT_QUERY, "db_execution_time_seconds": 9.0},
+    ])
+
+    shapes = mine_queries(str(tmp_path))
+    assert shapes[0]["count"] == 3 and shapes[0]["total_seconds"] == pytest.approx(6.0)
+    candidates = rollup_candidates(shapes, top=5, min_frequency=3)
+    assert [candidate["sql"] for candidate in candidates] == [HOT_QUERY]
+
+    entry = catalog.materialize(HOT_QUERY, baseline_seconds=candidates[0]["average_seconds"], frequency=3)
+    write_log(tmp_path, [
+        {"transaction_type": "ROLLUP_HIT", "sql_query": HOT_QUERY, "db_execution_time_seconds": 0.5},
+        {"transaction_type": "ROLLUP_HIT", "sql_query": HOT_QUERY, "db_execution_time_seconds": 0.25},
+        {"transaction_type": "ROLLUP_HIT", "sql_query": cold, "db_execution_time_seconds": 0.01},
+    ])
+
+    report = savings_report(str(tmp_path), [catalog])
+    assert report == {entry["table_name"]: {"hits": 2, "saved_seconds": pytest.approx(3.25)}}
+
+
+def test_relative_time_queries_are_never_rolled_up(tmp_path, catalog):
+    today = "SELECT region, COUNT(*) AS tickets FROM tickets WHERE created_at >= CURDATE() GROUP BY region"
+    assert uses_relative_time(today)
+    assert not uses_relative_time("SELECT COUNT(*) FROM tickets WHERE note = 'call me now'")
+
+    write_log(tmp_path, [{"transaction_type": "SQL_CHAT_SUCCESS", "sql_query": today, "db_execution_time_seconds": 2.0}] * 3)
+    assert rollup_candidates(mine_queries(str(tmp_path)), top=5, min_frequency=3) == []
+    with pytest.raises(ValueError):
+        catalog.materialize(today)
+    assert catalog.rewrite(today) == (None, None)
+
+
+def test_multi_statement_entries_are_mined_per_statement(tmp_path):
+    other = "SELECT COUNT(*) FROM tickets"
+    write_log(tmp_path, [
+        {"transaction_type": "SQL_CHAT_SUCCESS", "sql_query": f"{HOT_QUERY}; {other};", "db_execution_time_seconds": 4.0},
+    ] * 3)
+
+    candidates = rollup_candidates(mine_queries(str(tmp_path)), top=5, min_frequency=3)
+    assert sorted(candidate["sql"] for candidate in candidates) == sorted([HOT_QUERY, other])
+    assert all(candidate["total_seconds"] == pytest.approx(6.0) for candidate in candidates)
@@ -0,0 +1,74 @@
+import pytest
+
+from src.sqlguard import UnsafeQuery, ensure_read_only, referenced_tables, split_statements
+
+
+def test_split_statements_ignores_semicolons_in_literals():
+    sql = "SELECT * FROM a WHERE note = 'x;y'; SELECT COUNT(*) FROM b;"
+    assert split_statements(sql) == ["SELECT * FROM a WHERE note = 'x;y'", "SELECT COUNT(*) FROM b"]
+
+
+def test_quote_inside_comment_does_not_hide_a_statement():
+    statements = split_statements("SELECT 1 -- it's\n;DROP TABLE users;-- '")
+    assert statements == ["SELECT 1 -- it's", "DROP TABLE users"]
+    with pytest.raises(UnsafeQuery):
+        ensure_read_only(statements[1])
+
+
+def test_referenced_tables():
+    sql = "SELECT * FROM db.Users u JOIN `orders` o ON o.user_id = u.id WHERE u.name = 'from x'"
+    assert referenced_tables(sql) == {"users", "orders"}
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM a, b AS bb, c WHERE a.id = bb.id", {"a", "b", "c"}),
+    ("SELECT EXTRACT(YEAR FROM created_at), TRIM(LEADING 'x' FROM name) FROM tickets", {"tickets"}),
+    ("SELECT * FROM (SELECT id FROM a) x JOIN (b JOIN c ON b.id = c.id) ON x.id = b.id", {"a", "b", "c"}),
+    ("SELECT id FROM a WHERE id IN (SELECT a_id FROM b) ORDER BY id", {"a", "b"}),
+    ("SELECT 1 FROM DUAL", set()),
+])
+def test_referenced_tables_reads_from_clauses(sql, tables):
+    assert referenced_tables(sql) == tables
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM users",
+    "select region, replace(name, 'a', 'b') from users where updated_at > '2024-01-01'",
+    "WITH recent AS (SELECT * FROM users) SELECT COUNT(*) FROM recent",
+    "SELECT 'drop table users' AS note, created_by FROM users -- delete later",
+    "(SELECT id FROM a) UNION (SELECT id FROM b)",
+    "SELECT handler, load FROM tickets",
+    "SELECT * FROM users WHERE id = 1 LOCK IN SHARE MODE",
+    "WITH RECURSIVE n (i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n), m AS (SELECT 2) SELECT * FROM n, m",
+])
+def test_read_only_statements_pass(sql):
+    ensure_read_only(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "DROP TABLE users",
+    "DELETE FROM users",
+    "UPDATE users SET name = 'x'",
+    "SELECT * FROM users; DROP TABLE users",
+    "SELECT * INTO OUTFILE '/tmp/users' FROM users",
+    "SELECT * FROM users FOR UPDATE",
+    "SELECT /*! 1; DROP TABLE users */ 1",
+    "CALL refresh_stats()",
+    "REPLACE INTO users VALUES (1)",
+    "WITH old AS (SELECT id FROM users) DELETE FROM users WHERE id IN (SELECT id FROM old)",
+    "SELECT COUNT(*) INTO @total FROM users",
+    # "--" directly followed by a digit is two minus signs in MySQL, not a comment
+    "SELECT 1--1; DROP TABLE users",
+])
+def test_writes_are_rejected(sql):
+    with pytest.raises(UnsafeQuery):
+        ensure_read_only(sql)
+
+
+def test_semicolon_drop_is_split_and_rejected():
+    # No whitespace before DROP, so a keyword check on whitespace-separated words misses it
+    statements = split_statements("SELECT COUNT(*) FROM users;DROP TABLE users")
+    assert statements == ["SELECT COUNT(*) FROM users", "DROP TABLE users"]
+    ensure_read_only(statements[0])
+    with pytest.raises(UnsafeQuery):
+        ensure_read_only(statements[1])